@@ -0,0 +1,275 @@
+# bulk_ingest.py
+# Offline bulk ingestion of archived documents, e.g. when a new clinic onboards.
+#
+#   python bulk_ingest.py /data/clinic_archive --output results.jsonl --workers 8
+#   python bulk_ingest.py manifest.jsonl --db --source-name clinic-42
+#
+# The source is a directory (walked recursively for PDFs and images) or a manifest file:
+# JSONL with {"path": ..., "patient_identifier": ...} per line, or CSV with the same columns.
+# Files run through the same DocumentAnalyzer pipeline as /upload, on a process pool with one
+# model load per process. Completed paths are appended to a checkpoint file, so an interrupted
+# run resumes where it stopped (a file may be written twice if the run dies between writing
+# its result and its checkpoint entry). Failures are listed in <checkpoint>.failed.jsonl.
+# Transient ones (analysis errors, worker crashes) are retried on the next run; files that can
+# never succeed (corrupt or empty PDFs, unsupported files) are skipped unless --retry-failed is given.
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Set
+
+SUPPORTED_EXTENSIONS = {".pdf": "document", ".jpg": "image", ".jpeg": "image", ".png": "image"}
+
+# Analyzer statuses that come from the file itself, running it again gives the same result
+PERMANENT_FAILURES = {"failed_pdf_conversion", "no_images_generated", "unsupported_file_type", "no_document_images_for_qa"}
+
+
+# --- Worker process ---
+
+def _init_worker(threads: int):
+    """
+    Runs once per worker process: loads the models (module-level DocumentAnalyzer) and splits the cores.
+    """
+    import torch
+    torch.set_num_threads(threads)
+
+    from services.ocr_service import ocr_service
+    ocr_service.num_workers = threads # Keep each worker's OCR pool inside its share of the cores
+
+    from models.document_analyzer import document_analyzer # Importing loads LayoutLMv3 once for this process
+    document_analyzer.to_device()
+
+
+def _analyze_file(path: str, patient_identifier: str) -> Dict[str, Any]:
+    from models.document_analyzer import document_analyzer
+
+    file_type = SUPPORTED_EXTENSIONS[Path(path).suffix.lower()]
+    return asyncio.run(document_analyzer.analyze_local_file(path, file_type, patient_identifier))
+
+
+# --- Input discovery and checkpointing ---
+
+def discover_files(source: str) -> List[Tuple[str, str]]:
+    """
+    Returns (path, patient_identifier) pairs from a directory or a manifest file.
+    """
+    source_path = Path(source)
+    if source_path.is_dir():
+        files = []
+        for root, _, names in os.walk(source_path):
+            for name in sorted(names):
+                if Path(name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                    files.append((str(Path(root) / name), "anonymous"))
+        return sorted(files)
+
+    with open(source_path, newline="") as f:
+        if source_path.suffix.lower() == ".csv":
+            entries = list(csv.DictReader(f))
+        else:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+    files = []
+    for entry in entries:
+        if Path(entry["path"]).suffix.lower() not in SUPPORTED_EXTENSIONS:
+            print(f"Skipping unsupported file: {entry['path']}")
+            continue
+        files.append((entry["path"], entry.get("patient_identifier") or "anonymous"))
+    return files
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path) as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def mark(self, paths: List[str]):
+        with open(self.path, "a") as f:
+            f.writelines(f"{path}\n" for path in paths)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class FailureLog:
+    """
+    Appends one JSON line per failed file. Files with a permanent failure count as done on resume.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def load_permanent(self) -> Set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return {entry["source_path"] for entry in entries if entry.get("permanent")}
+
+    def record(self, source_path: str, status: str, error: str):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({
+                "source_path": source_path,
+                "status": status,
+                "error": error,
+                "permanent": status in PERMANENT_FAILURES,
+                "failed_at": datetime.now(timezone.utc).isoformat()
+            }) + "\n")
+
+
+# --- Output sinks ---
+
+class JsonlSink:
+    def __init__(self, path: str, checkpoint: Checkpoint):
+        self.file = open(path, "a")
+        self.checkpoint = checkpoint
+
+    async def add(self, source_path: str, result: Dict[str, Any]):
+        self.file.write(json.dumps({"source_path": source_path, **result}) + "\n")
+        self.file.flush()
+        self.checkpoint.mark([source_path])
+
+    async def close(self):
+        self.file.close()
+
+
+class DatabaseSink:
+    """
+    Buffers results and bulk-inserts them into triage_results, checkpointing each batch after it commits.
+    """
+    def __init__(self, batch_size: int, checkpoint: Checkpoint, source: str):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.source = source
+        self.rows: List[Dict[str, Any]] = []
+        self.paths: List[str] = []
+
+    async def add(self, source_path: str, result: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        self.rows.append({
+            "id": str(uuid.uuid4()),
+            "patient_identifier": result["patient_identifier"],
+            "status": "completed", # Only completed results reach the sink
+            "extracted_document_data": [{**result, "source_path": source_path, "ingestion_source": self.source}],
+            "created_at": now,
+            "updated_at": now,
+        })
+        self.paths.append(source_path)
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.rows:
+            return
+        from db.database import AsyncSessionLocal
+        from db.crud import bulk_create_triage_results
+
+        async with AsyncSessionLocal() as db:
+            await bulk_create_triage_results(db, self.rows)
+        self.checkpoint.mark(self.paths)
+        print(f"Inserted {len(self.rows)} triage result(s).")
+        self.rows, self.paths = [], []
+
+    async def close(self):
+        await self.flush()
+
+
+# --- Driver ---
+
+async def run(args: argparse.Namespace):
+    files = discover_files(args.source)
+    default_checkpoint = "bulk_ingest_db.checkpoint" if args.db else f"{args.output}.checkpoint"
+    checkpoint = Checkpoint(args.checkpoint or default_checkpoint)
+    failures = FailureLog(f"{checkpoint.path}.failed.jsonl")
+    done = checkpoint.load()
+    known_bad = set() if args.retry_failed else failures.load_permanent() - done
+    pending = [(path, patient) for path, patient in files if path not in done and path not in known_bad]
+    skipped = sum(path in known_bad for path, _ in files)
+    print(f"Found {len(files)} file(s), {len(files) - len(pending) - skipped} already done, {skipped} skipped as permanently failed, {len(pending)} to process.")
+    if not pending:
+        return
+
+    sink = DatabaseSink(args.db_batch_size, checkpoint, args.source_name) if args.db else JsonlSink(args.output, checkpoint)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    loop = asyncio.get_running_loop()
+
+    processed = failed = 0
+    started_at = time.monotonic()
+
+    # Spawned (not forked) workers: the parent never loads the models, every worker loads them once
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads,)
+    ) as pool:
+        queue = iter(pending)
+        in_flight = {}
+
+        def submit_next():
+            item = next(queue, None)
+            if item is not None:
+                in_flight[loop.run_in_executor(pool, _analyze_file, *item)] = item[0]
+
+        for _ in range(args.workers * 2): # Keep every worker busy without queueing the whole backlog
+            submit_next()
+
+        while in_flight:
+            finished, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                path = in_flight.pop(future)
+                processed += 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to process {path}: {e}") # Not checkpointed, retried on the next run
+                    failures.record(path, "worker_error", str(e))
+                else:
+                    if result["status"] == "completed":
+                        await sink.add(path, result)
+                    else:
+                        # Transient failures (e.g. an OCR pool crash) are retried on the next run, permanent ones are skipped
+                        failed += 1
+                        print(f"Failed to process {path}: {result['status']} ({result['error']})")
+                        failures.record(path, result["status"], result["error"])
+                submit_next()
+
+            if processed and processed % args.report_every == 0:
+                elapsed = time.monotonic() - started_at
+                print(f"{processed}/{len(pending)} docs, {processed / elapsed:.2f} docs/sec")
+
+    await sink.close()
+
+    elapsed = time.monotonic() - started_at
+    print(f"Done: {processed} doc(s) in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} docs/sec), {failed} failed.")
+    if failed:
+        print(f"Failed files are listed in {failures.path}. Transient failures are retried on the next run, use --retry-failed to retry the rest too.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the document analysis pipeline over a backlog of archived files.")
+    parser.add_argument("source", help="Directory to walk, or a .jsonl/.csv manifest with path and patient_identifier")
+    parser.add_argument("--output", default="bulk_ingest_results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--db", action="store_true", help="Bulk-insert results into triage_results instead of writing JSONL")
+    parser.add_argument("--db-batch-size", type=int, default=100, help="Rows per bulk insert")
+    parser.add_argument("--source-name", default="bulk_ingest", help="Clinic / source recorded with every result")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Worker processes (one model load each)")
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker, 0 splits the cores evenly")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to <output>.checkpoint, or bulk_ingest_db.checkpoint with --db)")
+    parser.add_argument("--retry-failed", action="store_true", help="Also retry files that failed permanently (e.g. corrupt PDFs) on an earlier run")
+    parser.add_argument("--report-every", type=int, default=50, help="Print throughput every N documents")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
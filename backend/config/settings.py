@@ -16,6 +16,16 @@ class Settings(BaseSettings):
     PGDATABASE: str
     PGPORT: int
 
+    # Database connection pool
+    DB_POOL_SIZE: int = 5 # Connections kept open per worker
+    DB_MAX_OVERFLOW: int = 10 # Extra connections allowed during bursts
+    DB_POOL_TIMEOUT: float = 30.0 # Seconds to wait for a free connection before failing
+    DB_POOL_RECYCLE: int = 1800 # Seconds after which a connection is replaced, -1 disables
+    DB_POOL_PRE_PING: bool = True # Check connections on checkout, drops ones closed by the server/proxy
+    DB_STATEMENT_CACHE_SIZE: int = 100 # asyncpg prepared statement cache per connection
+    DB_PGBOUNCER_MODE: bool = False # PgBouncer transaction pooling: no prepared statement caching, unique statement names
+    DB_POOL_SATURATION_WARNING: float = 0.8 # Log a warning when this fraction of the pool is checked out
+
     SUPABASE_URL: str
     SUPABASE_KEY: str # Use your anon public key or service role key for backend
     SUPABASE_STORAGE_BUCKET: str = "triageai-uploads" # Make sure this matches your bucket name in Supabase
@@ -24,6 +34,53 @@ class Settings(BaseSettings):
 
     LAYOUTLMV3_MODEL_ID: str = "rubentito/layoutlmv3-base-mpdocvqa" # Hugging Face model ID for document analysis
 
+    # OCR service (long-lived Tesseract workers)
+    TESSERACT_CMD: Optional[str] = None # Path to the tesseract binary for the pytesseract fallback, None uses the one on PATH
+    OCR_WORKERS: int = 0 # Number of OCR worker processes, 0 means one per CPU core
+    OCR_LANG: str = "eng" # Tesseract language(s), e.g. "eng+fra"
+    OCR_CONFIG: str = "" # Extra Tesseract options (--psm, --oem, --tessdata-dir, -c key=value), applied by both OCR backends
+
+    # Document QA page selection / early exit
+    QA_CONFIDENCE_THRESHOLD: float = 1.0 # Minimum score (start + end logit) for an answer to be kept
+    QA_EARLY_EXIT_THRESHOLD: float = 1.0 # A question stops visiting further pages once an answer reaches this score
+    QA_MAX_PAGES_PER_QUESTION: int = 0 # Most relevant pages asked per question, 0 means all pages
+    QA_SLIDING_WINDOW: bool = True # Split pages that exceed 512 tokens into overlapping windows instead of truncating
+    QA_WINDOW_STRIDE: int = 128 # Tokens shared between consecutive windows
+
+    # Form template fingerprinting (direct field lookup on known intake form layouts)
+    FORM_TEMPLATES_ENABLED: bool = True
+    FORM_TEMPLATE_STORE_PATH: str = "form_templates.json" # JSON file holding learned templates and their stats
+    FORM_TEMPLATE_MATCH_THRESHOLD: float = 0.7 # Minimum share of a template's anchor labels a page must contain to match it
+    FORM_TEMPLATE_LEARN_THRESHOLD: float = 5.0 # Minimum QA score for an answer to teach a field location
+    FORM_TEMPLATE_MIN_OBSERVATIONS: int = 3 # Times a field must be learned before it is read by region lookup
+    FORM_TEMPLATE_ANSWER_SCORE: float = 10.0 # Score given to answers read from a template
+    FORM_TEMPLATE_VERIFY_RATE: float = 0.05 # Fraction of template lookups also checked with LayoutLMv3
+    FORM_TEMPLATE_MAX_TEMPLATES: int = 500 # Least recently used templates are evicted beyond this
+    FORM_TEMPLATE_ANCHOR_SHARE: float = 0.8 # Share of a template's pages a label must appear on to stay an anchor
+    FORM_TEMPLATE_SAVE_INTERVAL: float = 300.0 # Minimum seconds between merges of learned templates and stats into the store file
+
+    # Image classification
+    IMAGE_BATCH_SIZE: int = 32 # Images preprocessed and classified per forward pass
+    IMAGE_DRAFT_DECODE: bool = True # Let the JPEG decoder downscale while decoding (much faster for large photos)
+
+    # Multi-worker deployment (see gunicorn_conf.py)
+    WEB_CONCURRENCY: int = 1 # Number of gunicorn workers forked from the model-loading master
+    TORCH_THREADS_PER_WORKER: int = 0 # Torch intra-op threads per worker, 0 splits the cores evenly between workers
+
+    # Archival of finished triage results
+    ARCHIVE_AFTER_DAYS: int = 0 # Finished triages older than this move to triage_results_archive, 0 disables the background job
+    ARCHIVE_INTERVAL_HOURS: float = 6.0 # How often the background archival job runs
+    ARCHIVE_BATCH_SIZE: int = 500 # Triages archived per transaction
+
+    # Triage scheduler (priority lanes + weighted fair queuing across sources)
+    SCHEDULER_CONCURRENCY: int = 1 # Number of triage jobs processed at the same time (model inference runs in threads)
+    SCHEDULER_URGENT_WORKERS: int = 1 # Extra workers that only run urgent jobs, so urgent uploads never wait for a running batch job
+    SCHEDULER_SHUTDOWN_GRACE_SECONDS: float = 20.0 # Time running jobs get to finish on shutdown before they are marked failed
+    SCHEDULER_URGENT_WEIGHT: float = 8.0 # Share of throughput given to the urgent lane
+    SCHEDULER_ROUTINE_WEIGHT: float = 4.0 # Share of throughput given to the routine lane
+    SCHEDULER_BATCH_WEIGHT: float = 1.0 # Share of throughput given to the batch lane
+    SCHEDULER_BATCH_COST_THRESHOLD: int = 200 # Routine jobs above this cost (pages x questions) are demoted to the batch lane
+
     @property
     def DATABASE_URL(self) -> str:
         return (
@@ -1,14 +1,19 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from db.models import TriageResult, UploadedFile
+from db.models import TriageResult, UploadedFile, TriageFileProgress, TriageResultArchive
 import uuid
-from typing import Optional
-from sqlalchemy import update
+import json
+import zlib
+from datetime import datetime
+from typing import Optional, List, Tuple
+from sqlalchemy import update, insert
 from sqlalchemy.orm import selectinload
+from utils.metrics import timed_query
 
 # CRUD operations for TriageResult and UploadedFile models
 
 # Create a new triage result
+@timed_query
 async def create_triage_result(db: AsyncSession, triage_id: str, patient_identifier: Optional[str] = None) -> TriageResult:
     triage_result = TriageResult(
         id=triage_id,
@@ -20,16 +25,73 @@ async def create_triage_result(db: AsyncSession, triage_id: str, patient_identif
     await db.refresh(triage_result)
     return triage_result
 
+# Insert many finished triage results in one statement (bulk ingestion)
+@timed_query
+async def bulk_create_triage_results(db: AsyncSession, rows: List[dict]) -> None:
+    if not rows:
+        return
+    await db.execute(insert(TriageResult), rows)
+    await db.commit()
+
 # Retrieve a triage result by ID
+@timed_query
 async def get_triage_result(db: AsyncSession, triage_id: str) -> Optional[TriageResult]:
     result = await db.execute(
         select(TriageResult)
-        .options(selectinload(TriageResult.uploaded_files))
+        .options(selectinload(TriageResult.uploaded_files), selectinload(TriageResult.file_progress))
         .where(TriageResult.id == triage_id)
     )
-    return result.scalars().first()
+    triage_result = result.scalars().first()
+
+    if triage_result is None:
+        # Not in the hot table, it may have been moved to the archive (slower: extra query + decompression)
+        triage_result = await get_archived_triage_result(db, triage_id)
+    return triage_result
+
+# Archived triage results are stored as one compressed JSON payload per triage
+def pack_archive_payload(payload: dict) -> bytes:
+    return zlib.compress(json.dumps(payload, default=str).encode("utf-8"), 6)
+
+def unpack_archive_payload(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+# Rebuild a (detached, read-only) TriageResult from the archive
+@timed_query
+async def get_archived_triage_result(db: AsyncSession, triage_id: str) -> Optional[TriageResult]:
+    result = await db.execute(select(TriageResultArchive).where(TriageResultArchive.id == triage_id))
+    archived = result.scalars().first()
+    if archived is None:
+        return None
+
+    payload = unpack_archive_payload(archived.payload)
+    triage = payload["triage_result"]
+    triage_result = TriageResult(
+        id=triage["id"],
+        patient_identifier=triage["patient_identifier"],
+        status=triage["status"],
+        urgency_level=triage["urgency_level"],
+        diagnostic_suggestions=triage["diagnostic_suggestions"],
+        extracted_document_data=triage["extracted_document_data"],
+        image_analysis_results=triage["image_analysis_results"],
+        created_at=_parse_datetime(triage["created_at"]),
+        updated_at=_parse_datetime(triage["updated_at"]),
+    )
+    triage_result.uploaded_files = [
+        UploadedFile(**{**uploaded_file, "upload_time": _parse_datetime(uploaded_file["upload_time"])})
+        for uploaded_file in payload["uploaded_files"]
+    ]
+    triage_result.file_progress = [
+        TriageFileProgress(**{**progress, "updated_at": _parse_datetime(progress["updated_at"])})
+        for progress in payload["file_progress"]
+    ]
+    triage_result.archived = True # Lets callers tell archived results apart
+    return triage_result
 
 # Update an existing triage result
+@timed_query
 async def update_triage_result(
     db: AsyncSession,
     triage_id: str,
@@ -61,6 +123,7 @@ async def update_triage_result(
     return db_triage
 
 # Create a new uploaded file entry
+@timed_query
 async def create_uploaded_file(
     db: AsyncSession,
     triage_id: str,
@@ -84,3 +147,48 @@ async def create_uploaded_file(
     await db.commit()
     await db.refresh(db_file)
     return db_file
+
+# Create one progress row per file of a triage
+@timed_query
+async def create_file_progress(db: AsyncSession, triage_id: str, files: List[Tuple[str, str]]) -> None:
+    db.add_all([
+        TriageFileProgress(
+            triage_id=triage_id,
+            file_path=file_path,
+            file_type=file_type,
+            status="pending",
+            pages_done=0,
+            partial_result={}
+        )
+        for file_path, file_type in files
+    ])
+    await db.commit()
+
+# Record progress for a single file.
+# partial_patch is merged into the stored JSONB with `||` so each write only carries the new keys,
+# instead of rewriting the whole growing result.
+@timed_query
+async def record_file_progress(
+    db: AsyncSession,
+    triage_id: str,
+    file_path: str,
+    status: Optional[str] = None,
+    pages_done: Optional[int] = None,
+    pages_total: Optional[int] = None,
+    partial_patch: Optional[dict] = None
+) -> None:
+    values = {}
+    if status is not None: values["status"] = status
+    if pages_done is not None: values["pages_done"] = pages_done
+    if pages_total is not None: values["pages_total"] = pages_total
+    if partial_patch: values["partial_result"] = TriageFileProgress.partial_result.concat(partial_patch)
+
+    if not values:
+        return
+
+    await db.execute(
+        update(TriageFileProgress)
+        .where(TriageFileProgress.triage_id == triage_id, TriageFileProgress.file_path == file_path)
+        .values(**values)
+    )
+    await db.commit()
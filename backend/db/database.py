@@ -1,8 +1,14 @@
 # db/database.py
+import time
+import uuid
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config.settings import settings
 from datetime import datetime, timezone
+from utils.metrics import metrics
 
 # Construct the database URL from individual settings
 SQLALCHEMY_DATABASE_URL = (
@@ -11,9 +17,105 @@ SQLALCHEMY_DATABASE_URL = (
 )
 
 
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long each checkout took and how often it timed out.
+    A checkout includes opening a new connection when the pool has room to grow, that part is
+    also recorded on its own as db.pool.connect_seconds.
+    """
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.incr("db.pool.timeouts")
+            raise
+        finally:
+            metrics.observe("db.pool.checkout_seconds", time.perf_counter() - start)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            metrics.observe("db.pool.connect_seconds", time.perf_counter() - start)
+
+
+def _connect_args() -> dict:
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer in transaction mode hands each transaction a different server connection, so
+        # named prepared statements cannot be cached and must not collide between clients.
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+
 # Use create_async_engine for async database operations
-# NO connect_args for SSL here! The sslmode is handled by the URL.
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
+# NO SSL options in connect_args here! The sslmode is handled by the URL.
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args=_connect_args()
+)
+
+# DB_MAX_OVERFLOW=-1 means unlimited overflow in SQLAlchemy: the pool has no capacity to saturate,
+# so saturation is reported as None and never warns.
+_pool_capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW if settings.DB_MAX_OVERFLOW >= 0 else None
+_saturation_warned = False
+
+def _pool_saturation(checked_out: int):
+    if not _pool_capacity:
+        return None
+    return checked_out / _pool_capacity
+
+def _record_pool_usage(checked_out: int):
+    global _saturation_warned
+    metrics.set_gauge("db.pool.checked_out", checked_out)
+    saturation = _pool_saturation(checked_out)
+    if saturation is None:
+        return
+    metrics.set_gauge("db.pool.saturation", saturation)
+
+    # Warn once per burst, before checkouts start timing out
+    if saturation >= settings.DB_POOL_SATURATION_WARNING and not _saturation_warned:
+        _saturation_warned = True
+        metrics.incr("db.pool.saturation_warnings")
+        print(f"WARNING: DB pool {saturation:.0%} saturated ({checked_out}/{_pool_capacity} connections checked out)")
+    elif saturation < settings.DB_POOL_SATURATION_WARNING:
+        _saturation_warned = False
+
+def _on_checkout(*_):
+    _record_pool_usage(engine.sync_engine.pool.checkedout())
+
+def _on_checkin(*_):
+    # The checkin event fires before the connection is back in the queue, so it is still counted
+    _record_pool_usage(max(engine.sync_engine.pool.checkedout() - 1, 0))
+
+event.listen(engine.sync_engine.pool, "checkout", _on_checkout)
+event.listen(engine.sync_engine.pool, "checkin", _on_checkin)
+
+def get_pool_status() -> dict:
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "saturation": _pool_saturation(pool.checkedout()),
+        "pgbouncer_mode": settings.DB_PGBOUNCER_MODE,
+    }
 
 # Use async_sessionmaker for async sessions
 AsyncSessionLocal = async_sessionmaker(
@@ -32,4 +134,3 @@ async def get_db() -> AsyncSession:
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
\ No newline at end of file
@@ -1,7 +1,8 @@
 # db/models.py
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from db.database import Base
 
@@ -19,6 +20,7 @@ class TriageResult(Base):
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)) 
 
     uploaded_files = relationship("UploadedFile", back_populates="triage_result")
+    file_progress = relationship("TriageFileProgress", back_populates="triage_result")
 
 class UploadedFile(Base):
     __tablename__ = "uploaded_files" 
@@ -32,4 +34,29 @@ class UploadedFile(Base):
     file_type = Column(String) # e.g., 'document', 'image'
     public_url = Column(String, nullable=True) # Public URL if bucket is public, or for signed URLs
 
-    triage_result = relationship("TriageResult", back_populates="uploaded_files")
\ No newline at end of file
+    triage_result = relationship("TriageResult", back_populates="uploaded_files")
+
+class TriageFileProgress(Base):
+    __tablename__ = "triage_file_progress"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4())) # unique id for the progress row
+    triage_id = Column(String, ForeignKey("triage_results.id"), nullable=False, index=True)
+    file_path = Column(String, nullable=False) # The path/key within the Supabase bucket
+    file_type = Column(String) # e.g., 'document', 'image'
+    status = Column(String, default="pending") # e.g., pending, processing, completed, failed
+    pages_done = Column(Integer, default=0) # Pages analyzed so far
+    pages_total = Column(Integer, nullable=True) # Known once the file has been converted to images
+    partial_result = Column(JSONB, default=dict) # Per-page answers ("page_<n>") merged in as they complete, plus the final "result"
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    triage_result = relationship("TriageResult", back_populates="file_progress")
+
+class TriageResultArchive(Base):
+    __tablename__ = "triage_results_archive"
+
+    id = Column(String, primary_key=True) # Same id as the original triage result
+    patient_identifier = Column(String, nullable=True, index=True)
+    status = Column(String) # Status at archive time, e.g. completed, failed
+    created_at = Column(DateTime(timezone=True)) # When the triage was created
+    archived_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    payload = Column(LargeBinary, nullable=False) # zlib-compressed JSON: triage row, uploaded files and file progress
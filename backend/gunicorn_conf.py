@@ -0,0 +1,58 @@
+# gunicorn_conf.py
+# Multi-worker deployment that shares model weights between workers.
+#
+#   gunicorn -c gunicorn_conf.py main:app
+#
+# The app is imported once in the master (preload_app), which loads LayoutLMv3 and any other
+# module-level models. Workers are forked from it and share the weight pages copy-on-write,
+# so N workers cost roughly one copy of the weights plus their own working memory.
+# Per-worker memory is reported at /health/memory.
+#
+# GPU: the master loads the models on CPU and every worker moves LayoutLMv3 to the GPU in the app
+# lifespan, since forked workers cannot reuse a CUDA context from the master. Each worker then holds
+# its own copy of the weights in GPU memory, so keep WEB_CONCURRENCY low (usually 1) on GPU hosts.
+#
+# Scheduling: every worker runs its own in-memory TriageScheduler. Fair queuing and the urgent lane
+# only apply within a worker, so an urgent upload can wait behind a large job in its worker while
+# another worker is idle. Size WEB_CONCURRENCY x SCHEDULER_CONCURRENCY with that in mind.
+import gc
+import os
+
+from config.settings import settings
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = settings.WEB_CONCURRENCY
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True # Load models in the master before forking
+
+# The master only loads weights, keep its intra-op pool small (this file is read before the app is preloaded).
+# Workers set their own share of the cores after the fork.
+import torch
+torch.set_num_threads(1)
+
+
+def _threads_per_worker() -> int:
+    if settings.TORCH_THREADS_PER_WORKER > 0:
+        return settings.TORCH_THREADS_PER_WORKER
+    return max(1, (os.cpu_count() or 1) // workers) # Split the cores so workers do not oversubscribe them
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (models included) out of the GC's tracked generations.
+    # Otherwise the first collection in a worker writes to those objects and un-shares their pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+    from services.ocr_service import ocr_service
+
+    threads = _threads_per_worker()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # Already set in this process
+    if settings.OCR_WORKERS == 0:
+        ocr_service.num_workers = threads # OCR processes share the same slice of cores
+    server.log.info(f"Worker {worker.pid}: {threads} torch thread(s), {ocr_service.num_workers} OCR worker(s)")
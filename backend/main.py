@@ -1,9 +1,14 @@
 # main.py
 from fastapi import FastAPI
 from contextlib import asynccontextmanager # New import
+import asyncio
 from routers import upload, triage, health
 from config.settings import settings
 from db.database import init_db # Assuming init_db is synchronous
+from services.triage_scheduler import triage_scheduler
+from services.ocr_service import ocr_service
+from services.archival import run_archival_loop
+from models.document_analyzer import document_analyzer
 
 # Define the lifespan context manager
 @asynccontextmanager
@@ -13,16 +18,25 @@ async def lifespan(app: FastAPI):
     await init_db() # Call your synchronous init_db() function
     print("Application startup: Database initialized.")
 
-    # You could potentially load AI models here and store them on app.state
-    # For example:
-    # from models.document_analyzer import DocumentAnalyzer
-    # app.state.document_analyzer = DocumentAnalyzer()
-    # print("AI models loaded.")
+    # AI models are loaded at import time (models/document_analyzer.py), not here: the lifespan runs
+    # in every worker, while module-level models are loaded once by the gunicorn master (preload_app)
+    # and shared copy-on-write by all workers. See gunicorn_conf.py.
+    document_analyzer.to_device() # CUDA is only initialized here, after the fork
+
+    await triage_scheduler.start() # Start the workers that run queued triages
+
+    archival_task = None
+    if settings.ARCHIVE_AFTER_DAYS > 0: # Keep the hot triage tables small
+        archival_task = asyncio.create_task(run_archival_loop())
 
     yield # This is where the application starts serving requests
 
     # Shutdown event: Clean up resources
     print("Application shutdown: Cleaning up resources...")
+    await triage_scheduler.stop()
+    if archival_task:
+        archival_task.cancel()
+    ocr_service.shutdown()
     # If you had global resources (like a shared AI model instance)
     # that needed explicit closing or releasing, you'd do it here.
     # For database connections managed by `get_db`, explicit closing isn't usually needed here.
@@ -37,7 +51,7 @@ app = FastAPI(
 )
 
 # Include routers
-#app.include_router(health.router, prefix="/health", tags=["Health"])
+app.include_router(health.router, prefix="/health", tags=["Health"])
 app.include_router(upload.router, tags=["Upload"])
 app.include_router(triage.router, tags=["Triage"])
 
@@ -1,41 +1,80 @@
 # services/document_analyzer.py
+import asyncio
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 import fitz # PyMuPDF for PDF handling
 from PIL import Image
 import io # To handle image bytes
+import random
 from transformers import AutoProcessor, AutoModelForDocumentQuestionAnswering
 from supabase import create_client
 from transformers import AutoModelForImageClassification
 import torch
 from config.settings import settings
 from services.file_manager import file_manager # This handles downloading from Supabase
-import pytesseract
-
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from utils.metrics import metrics
+from models.form_templates import form_template_store
+from services.ocr_service import ocr_service # Parallel OCR on long-lived Tesseract workers
 
 
 # Moved Supabase client initialization to a more appropriate place if needed, or ensure it's handled externally.
 # For demonstration, I'll keep it outside the class but remind to consider dependency injection.
 supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY) # Uncommented for direct use as per original code
 
+# Questions asked of every document page. Also used by the scheduler to estimate job cost.
+QUESTIONS_FOR_FORM = [
+    "What is the patient's full name?",
+    "What is the patient's date of birth?",
+    "What is the patient's phone number?",
+    "What is their primary complaint?",
+    "List all known allergies.",
+    "What medications are they currently taking?",
+    "What is the patient's address?"
+    # Add more questions specific to your forms
+]
+
+# Cheap OCR keyword signals used to rank pages for each question before running QA
+QUESTION_KEYWORDS = {
+    "What is the patient's full name?": ["name", "patient", "first name", "last name"],
+    "What is the patient's date of birth?": ["dob", "date of birth", "birth", "born"],
+    "What is the patient's phone number?": ["phone", "telephone", "tel", "mobile", "cell"],
+    "What is their primary complaint?": ["complaint", "reason for visit", "symptoms", "chief"],
+    "List all known allergies.": ["allergies", "allergy", "allergic", "nkda"],
+    "What medications are they currently taking?": ["medications", "medication", "meds", "prescriptions", "mg"],
+    "What is the patient's address?": ["address", "street", "city", "postal", "zip"],
+}
+
+# Common problematic answers to filter out
+ANSWER_BLACKLIST = [
+    "PATIENT CONSENT", "PATIENT DETAILS", "MEDICAL HISTORY",
+    "PHYSICIAN", "DOCTOR", "BIRTH", "ACTIVE TREATING PHYSICIANS",
+    "SECONDARY INSURANCE POLICY", "PREFFERED PHARMACY", "STREET ADDRESS",
+    "2 OF 6", "3", "4", "5", "6", # Page numbers
+    # Add more as you observe problematic common extractions
+]
+
+# Questions where a short bare number is most likely a page number
+NUMERIC_QUESTIONS = [
+    "What is the patient's phone number?",
+    "What is the patient's date of birth?",
+    "What is the patient's address?"
+]
+
 class DocumentAnalyzer:
     def __init__(self):
         self.layoutlmv3_processor = None 
         self.layoutlmv3_model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu" # Set device to GPU if available, else CPU
+        self.device = "cpu" # Moved to the GPU by to_device() once the serving process is running
         if settings.LAYOUTLMV3_MODEL_ID:
            
             try:
                 self.layoutlmv3_processor = AutoProcessor.from_pretrained( # Load the LayoutLMv3 processor
                     settings.LAYOUTLMV3_MODEL_ID,
-                    apply_ocr=True # <-- Enable OCR processing
+                    apply_ocr=False # OCR runs once per page through the OCR service instead of once per question
                 )
                 self.layoutlmv3_model = AutoModelForDocumentQuestionAnswering.from_pretrained(settings.LAYOUTLMV3_MODEL_ID) 
-                
-                if torch.cuda.is_available():
-                    self.layoutlmv3_model.to("cuda")
+                self.layoutlmv3_model.eval()
                 
 
             except Exception as e:
@@ -44,12 +83,206 @@ class DocumentAnalyzer:
             print("LAYOUTLMV3_MODEL_ID not set in settings. Document analysis will be skipped.")
 
 
-    async def analyze_document(self, file_path_in_supabase: str, file_type: str, patient_identifier: str) -> Dict[str, Any]:
+    def to_device(self):
+        """
+        Moves LayoutLMv3 to the GPU when one is available. Called once per serving process (app lifespan,
+        bulk ingestion workers) rather than at import: the gunicorn master imports this module before
+        forking, and forked workers cannot use a CUDA context created in their parent.
+        """
+        if self.layoutlmv3_model is None or self.device == "cuda" or not torch.cuda.is_available():
+            return
+        self.layoutlmv3_model.to("cuda")
+        self.device = "cuda"
+        print(f"LayoutLMv3 moved to GPU in process {os.getpid()}.")
+
+    def _prepare_page(self, image: Image.Image, words: List[str], boxes: List[List[int]]) -> Dict[str, Any]:
+        """
+        Bundles a page's OCR output with its pixel values, so every question asked of the page can reuse them.
+        :return: words, boxes (normalized to 0-1000), pixel_values and the lowercased page text.
+        """
+        pixel_values = self.layoutlmv3_processor.image_processor(image, return_tensors="pt")["pixel_values"]
+        return {
+            "words": words,
+            "boxes": boxes,
+            "pixel_values": pixel_values,
+            "text": " ".join(words).lower()
+        }
+
+    def _rank_pages(self, question: str, pages: List[Optional[Dict[str, Any]]]) -> List[int]:
+        """
+        Orders page indices by how many of the question's keywords appear in the page text.
+        Ties keep document order, pages without any OCR text are dropped.
+        """
+        keywords = QUESTION_KEYWORDS.get(question, [])
+        candidates = [i for i, page in enumerate(pages) if page and page["words"]]
+        scores = {i: sum(pages[i]["text"].count(keyword) for keyword in keywords) for i in candidates}
+        ranked = sorted(candidates, key=lambda i: (-scores[i], i))
+
+        if settings.QA_MAX_PAGES_PER_QUESTION > 0:
+            ranked = ranked[:settings.QA_MAX_PAGES_PER_QUESTION]
+        return ranked
+
+    def _answer_questions(self, page: Dict[str, Any], questions: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Runs LayoutLMv3 QA for several questions on one page in a single batched forward pass.
+
+        Pages whose OCR text does not fit the 512-token window are split into overlapping windows
+        (QA_WINDOW_STRIDE tokens of overlap), every window of every question goes into the same batch,
+        and each question keeps its best scoring span across windows. Pages that fit produce exactly
+        one window per question, so they cost the same as before.
+
+        A span only counts when it scores above the window's [CLS] null score, the model's way of saying
+        the page does not contain the answer.
+        :return: question -> {'answer', 'score', 'word_indices'} where word_indices are the OCR words the answer spans.
+                 Questions without an answer on this page are left out.
+        """
+        encoding = self.layoutlmv3_processor.tokenizer(
+            questions,
+            [page["words"]] * len(questions),
+            boxes=[page["boxes"]] * len(questions),
+            padding=True,
+            truncation="only_second",
+            max_length=512,
+            stride=settings.QA_WINDOW_STRIDE,
+            return_overflowing_tokens=settings.QA_SLIDING_WINDOW,
+            return_tensors="pt"
+        )
+        # Row b of the batch is a window of question sample_mapping[b]
+        sample_mapping = encoding.pop("overflow_to_sample_mapping", None)
+        sample_mapping = sample_mapping.tolist() if sample_mapping is not None else list(range(len(questions)))
+        num_windows = len(sample_mapping)
+        if num_windows > len(questions):
+            print(f"    Page overflows 512 tokens, scoring {num_windows} windows for {len(questions)} question(s).")
+            metrics.incr("document_analyzer.overflow_windows", num_windows - len(questions))
+
+        inputs = {k: v.to(self.device) for k, v in encoding.items()}
+        inputs["pixel_values"] = page["pixel_values"].expand(num_windows, -1, -1, -1).to(self.device)
+
+        with torch.no_grad(): # Use no_grad for inference to save memory and speed up
+            outputs = self.layoutlmv3_model(**inputs)
+
+        results = {}
+        for b in range(num_windows):
+            q = questions[sample_mapping[b]]
+
+            # Only OCR words can be part of an answer, mask the question, special and padding tokens
+            sequence_ids = encoding.sequence_ids(b)
+            context_mask = torch.tensor([sid == 1 for sid in sequence_ids], device=outputs.start_logits.device)
+            start_logits = outputs.start_logits[b].masked_fill(~context_mask, -1e4)
+            end_logits = outputs.end_logits[b].masked_fill(~context_mask, -1e4)
+
+            answer_start = torch.argmax(start_logits).item() # Start position of the answer
+            answer_end = torch.argmax(end_logits).item() + 1 # End position of the answer (add 1 to include the end token)
+            confidence_score = start_logits[answer_start].item() + end_logits[answer_end - 1].item()
+
+            null_score = outputs.start_logits[b][0].item() + outputs.end_logits[b][0].item() # Score of the empty [CLS] span
+            if confidence_score <= null_score:
+                continue # The model prefers "no answer" for this window
+
+            if q in results and results[q]['score'] >= confidence_score:
+                continue # An earlier window of this question already has a better span
+
+            answer = self.layoutlmv3_processor.tokenizer.decode(
+                encoding["input_ids"][b][answer_start:answer_end],
+                skip_special_tokens=True
+            ).strip()
+            word_ids = encoding.word_ids(b)[answer_start:answer_end]
+
+            results[q] = {
+                'answer': answer,
+                'score': confidence_score,
+                'word_indices': sorted({w for w in word_ids if w is not None})
+            }
+
+        unanswered = len(set(questions) - set(results))
+        if unanswered:
+            metrics.incr("document_analyzer.null_answers", unanswered)
+        return results
+
+    def _learn_field_locations(self, pages: List[Optional[Dict[str, Any]]], extracted_kv_pairs: Dict[str, List[Dict[str, Any]]]):
+        """
+        Teaches the form template store where each confidently answered field sits on its page.
+        Only the best LayoutLMv3 answer per question is used, template lookups are never learned from.
+        """
+        fields_by_page: Dict[int, Dict[str, List[float]]] = {} # page index -> question -> answer box
+        answer_words_by_page: Dict[int, set] = {} # page index -> OCR word indices that are answers
+        for question, answers in extracted_kv_pairs.items():
+            qa_answers = [a for a in answers if a.get('source') != 'template' and a.get('word_indices')]
+            if not qa_answers:
+                continue
+            best = max(qa_answers, key=lambda a: a['score'])
+            if best['score'] < settings.FORM_TEMPLATE_LEARN_THRESHOLD or not self._is_acceptable_answer(question, best['answer'], best['score']):
+                continue
+
+            page_idx = best['page'] - 1
+            page = pages[page_idx]
+            if not page:
+                continue
+
+            answer_boxes = [page["boxes"][w] for w in best['word_indices']]
+            fields_by_page.setdefault(page_idx, {})[question] = [
+                min(b[0] for b in answer_boxes),
+                min(b[1] for b in answer_boxes),
+                max(b[2] for b in answer_boxes),
+                max(b[3] for b in answer_boxes)
+            ]
+            answer_words_by_page.setdefault(page_idx, set()).update(best['word_indices'])
+
+        for page_idx, fields in fields_by_page.items():
+            page = pages[page_idx]
+            if "fingerprint" not in page:
+                page["fingerprint"] = form_template_store.fingerprint(page["words"], page["boxes"])
+            answer_words = sorted(answer_words_by_page[page_idx])
+            value_tokens = form_template_store.fingerprint([page["words"][w] for w in answer_words], [page["boxes"][w] for w in answer_words])
+            form_template_store.learn_page(page["fingerprint"], fields, value_tokens)
+
+    @staticmethod
+    def _is_acceptable_answer(question: str, answer: str, score: float) -> bool:
+        if score < settings.QA_CONFIDENCE_THRESHOLD:
+            return False # Below threshold
+        if answer.strip().upper() in ANSWER_BLACKLIST:
+            return False # Blacklisted answer
+        if question in NUMERIC_QUESTIONS and answer.strip().isdigit() and len(answer.strip()) < 5:
+            return False # Likely a page number or irrelevant digit
+        return True
+
+    def _select_best_answer(self, question: str, answers: List[Dict[str, Any]]) -> str:
+        """
+        Picks the highest scoring acceptable answer for a question, or "Not Found".
+        """
+        for item in sorted(answers, key=lambda x: x['score'], reverse=True):
+            best_answer = item['answer'].strip()
+            if not self._is_acceptable_answer(question, best_answer, item['score']):
+                continue
+
+            # Cleaning for "What is the patient's full name?"
+            if question == "What is the patient's full name?":
+                if best_answer.startswith("PATIENT DETAILS"):
+                    # This handles "PATIENT DETAILS First Name: Dylan Last Name: Wettlaufer"
+                    # We want just "Dylan Wettlaufer"
+                    best_answer = best_answer.replace("PATIENT DETAILS", "").strip()
+                    best_answer = best_answer.replace("First Name:", "").replace("Last Name:", "").strip()
+                elif best_answer.startswith("First Name:"):
+                    best_answer = best_answer.replace("First Name:", "").replace("Last Name:", "").strip()
+            return best_answer
+
+        return "Not Found" # If no valid answer found, store a default message
+
+    async def analyze_document(
+        self,
+        file_path_in_supabase: str,
+        file_type: str,
+        patient_identifier: str,
+        progress_callback: Optional[Callable[[int, int, Optional[int], Optional[Dict[str, Any]]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
         """
         Analyze a document (PDF) to extract patient information using LayoutLMv3.
         :param file_path_in_supabase: The path of the file in Supabase Storage.
         :param file_type: The type of the file (e.g., "pdf").
         :param patient_identifier: The patient identifier to associate with the analysis.
+        :param progress_callback: Optional coroutine called as (pages_done, pages_total, page_number, page_answers) once the
+                                  page count is known (page_number and page_answers are None) and after every analyzed page.
+                                  page_answers holds every answer found on that page so far.
         :return: A dictionary containing the extracted patient information.
         """
 
@@ -80,6 +313,53 @@ class DocumentAnalyzer:
             print(f"Error downloading file {file_path_in_supabase}: {e}")
             return analysis_results # Return early if download fails
         
+        try:
+            await self._analyze_file(local_file_path, file_type, analysis_results, progress_callback)
+
+        finally:
+            # Clean up the local file if it was downloaded
+            if local_file_path and os.path.exists(local_file_path):
+                os.remove(local_file_path)
+                print(f"Cleaned up local file: {local_file_path}")
+            print(f"Finished analysis for file: {file_path_in_supabase}, status: {analysis_results['status']}")
+
+        return analysis_results
+
+    async def analyze_local_file(
+        self,
+        local_file_path: str,
+        file_type: str,
+        patient_identifier: str,
+        progress_callback: Optional[Callable[[int, int, Optional[int], Optional[Dict[str, Any]]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Same pipeline as analyze_document for a file that is already on local disk (e.g. bulk ingestion).
+        The file is left in place.
+        :param local_file_path: Path of the PDF or image on disk.
+        :param file_type: "document" or "image".
+        :param patient_identifier: The patient identifier to associate with the analysis.
+        :return: A dictionary containing the extracted patient information.
+        """
+        analysis_results = {
+            "file_path": local_file_path,
+            "patient_identifier": patient_identifier,
+            "extracted_data": {},
+            "image_classification_results": {},
+            "status": "pending",
+            "error": None
+        }
+        return await self._analyze_file(local_file_path, file_type, analysis_results, progress_callback)
+
+    async def _analyze_file(
+        self,
+        local_file_path: str,
+        file_type: str,
+        analysis_results: Dict[str, Any],
+        progress_callback: Optional[Callable[[int, int, Optional[int], Optional[Dict[str, Any]]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Converts a local file to page images and runs QA on them, filling in analysis_results.
+        """
         document_images: List[Image.Image] = [] # This will hold the images extracted from the document
 
         try: # Check if the file is a PDF or an image
@@ -122,134 +402,143 @@ class DocumentAnalyzer:
             if self.layoutlmv3_processor and self.layoutlmv3_model and document_images:
                 print("Starting LayoutLMv3 analysis...")
 
-                questions_for_form = [
-                        "What is the patient's full name?",
-                        "What is the patient's date of birth?",
-                        "What is the patient's phone number?",
-                        "What is their primary complaint?",
-                        "List all known allergies.",
-                        "What medications are they currently taking?",
-                        "What is the patient's address?"
-                        # Add more questions specific to your forms
-                    ]
-                
+                questions_for_form = QUESTIONS_FOR_FORM
+                pages_total = len(document_images)
+
                 extracted_kv_pairs = {q: [] for q in questions_for_form} # stores the extracted key-value pairs from the document
 
+                if progress_callback:
+                    await progress_callback(0, pages_total, None, None) # Page count is known now
+
+                # OCR every page once, in parallel; the words and boxes are reused for page ranking and for every question
+                valid_pages = []
                 for i, image_page in enumerate(document_images):
                     if not isinstance(image_page, Image.Image): # Check if image_page is a valid PIL Image object
                         print(f"Skipping page {i+1}: Not a valid PIL Image object found in document_images. Type: {type(image_page)}")
                         continue # Skip to next image if this one is somehow corrupted or not an image
+                    valid_pages.append(i)
+
+                ocr_results = await ocr_service.ocr_pages([document_images[i] for i in valid_pages])
+
+                pages: List[Optional[Dict[str, Any]]] = [None] * pages_total
+                for i, (words, boxes) in zip(valid_pages, ocr_results):
+                    pages[i] = self._prepare_page(document_images[i], words, boxes)
+
+                active_questions = list(questions_for_form) # Questions still waiting for a confident answer
+                page_answers_by_page: Dict[int, Dict[str, Any]] = {} # page number -> best raw answer per question
+                pages_visited = set()
+                forward_passes = 0 # (page, question) pairs actually scored
+                template_answers = 0 # Fields read from a known form layout instead of LayoutLMv3
+
+                # Pages matching a known form layout answer their learned fields by region lookup, skipping QA
+                if settings.FORM_TEMPLATES_ENABLED:
+                    for page_idx, page in enumerate(pages):
+                        if not page or not page["words"] or not active_questions:
+                            continue
+                        page["fingerprint"] = form_template_store.fingerprint(page["words"], page["boxes"])
+                        template, similarity = form_template_store.match(page["fingerprint"])
+                        if template is None:
+                            continue
+
+                        page_template_answers = {}
+                        for q in list(active_questions):
+                            answer = form_template_store.extract(template, page["words"], page["boxes"], q)
+                            if answer is None or not self._is_acceptable_answer(q, answer, settings.FORM_TEMPLATE_ANSWER_SCORE):
+                                continue # Not learned yet or empty region, LayoutLMv3 will handle it
+                            extracted_kv_pairs[q].append({
+                                'answer': answer,
+                                'score': settings.FORM_TEMPLATE_ANSWER_SCORE,
+                                'page': page_idx + 1,
+                                'source': 'template'
+                            })
+                            page_template_answers[q] = answer
+                            page_answers_by_page.setdefault(page_idx + 1, {})[q] = {'answer': answer, 'score': settings.FORM_TEMPLATE_ANSWER_SCORE}
+                            active_questions.remove(q)
+
+                        if not page_template_answers:
+                            continue
+                        template_answers += len(page_template_answers)
+                        print(f"Page {page_idx+1} matched form template {template.id} (similarity {similarity:.2f}), {len(page_template_answers)} field(s) read directly.")
+
+                        # Spot-check a sample of template lookups against LayoutLMv3 to track agreement
+                        if random.random() < settings.FORM_TEMPLATE_VERIFY_RATE:
+                            qa_results = await asyncio.to_thread(self._answer_questions, page, list(page_template_answers))
+                            forward_passes += len(page_template_answers)
+                            for q, answer in page_template_answers.items():
+                                form_template_store.record_agreement(template, answer, qa_results.get(q, {}).get('answer', ""))
+
+                # Most relevant pages first for every question, capped at QA_MAX_PAGES_PER_QUESTION
+                page_order = {q: self._rank_pages(q, pages) for q in questions_for_form}
+
+                for rank in range(pages_total):
+                    # Questions that want the same page at this rank share one batched forward pass
+                    questions_by_page: Dict[int, List[str]] = {}
+                    for q in active_questions:
+                        if rank < len(page_order[q]):
+                            questions_by_page.setdefault(page_order[q][rank], []).append(q)
+
+                    if not questions_by_page:
+                        break # Every question is answered or has run out of pages
+
+                    for page_idx, page_questions in questions_by_page.items():
+                        print(f"Processing page {page_idx+1} with LayoutLMv3 ({len(page_questions)} question(s), rank {rank+1})...")
 
-                    print(f"Processing page {i+1} with LayoutLMv3...")
-
-                    # Process each question individually on the current image page
-                    for q_idx, q in enumerate(questions_for_form):
                         try:
-                            
-                            # Prepare inputs for each question on the current image
-                            single_question_inputs = self.layoutlmv3_processor(
-                                images=image_page,
-                                text=[q], # Pass just the current question
-                                return_tensors="pt"
-                            ).to(self.device) # Move to device here
-
-                            with torch.no_grad(): # Use no_grad for inference to save memory and speed up
-                                outputs = self.layoutlmv3_model(**single_question_inputs)
-
-                            start_logits = outputs.start_logits # Get the start logits for the answer
-                            end_logits = outputs.end_logits # Get the end logits for the answer
-                            answer_start = torch.argmax(start_logits) # Get the index of the start position of the answer
-                            answer_end = torch.argmax(end_logits) + 1  # Get the index of the end position of the answer (add 1 to include the end token)
-
-                            current_start_logit = start_logits[0, answer_start].item() # Get the logit for the start position
-                            current_end_logit = end_logits[0, answer_end - 1].item() # Get the logit for the end position
-
-                            confidence_score = current_start_logit + current_end_logit # Confidence score for the answer
+                            # Off the event loop, so other triages and status requests keep running during inference
+                            page_results = await asyncio.to_thread(self._answer_questions, pages[page_idx], page_questions)
+                            forward_passes += len(page_questions)
+                        except Exception as e:
+                            print(f"    Error processing page {page_idx+1}: {e}")
+                            continue
 
-                            # Decode the answer
-                            answer = self.layoutlmv3_processor.tokenizer.decode(
-                                single_question_inputs["input_ids"][0][answer_start:answer_end],
-                                skip_special_tokens=True
-                            ).strip()
+                        page_answers = page_answers_by_page.setdefault(page_idx + 1, {})
+                        for q, result in page_results.items():
+                            answer = result['answer']
+                            confidence_score = result['score']
 
                             if answer and answer not in ["[CLS]", "[SEP]", ""]: # Valid answer found
                                 extracted_kv_pairs[q].append({
                                     'answer': answer,
                                     'score': confidence_score,
-                                    'page': i + 1
+                                    'page': page_idx + 1,
+                                    'word_indices': result['word_indices']
                                 })
+                                page_answers[q] = {'answer': answer, 'score': confidence_score}
+                                print(f"    Q: {q} -> A: {answer}, score: {confidence_score}, page: {page_idx + 1}")
 
-                                print(f"    Q: {q} -> A: {answer}, score: {confidence_score}, page: {i + 1}")
+                                # Retire the question once it has a usable answer, the remaining pages are skipped
+                                if confidence_score >= settings.QA_EARLY_EXIT_THRESHOLD and self._is_acceptable_answer(q, answer, confidence_score):
+                                    active_questions.remove(q)
 
-                            elif q not in extracted_kv_pairs: # If not found yet for this question across all pages
-                                extracted_kv_pairs[q].append({
-                                    'answer': "Not Found (Empty/Special)",
-                                    'score': -100.0, # Very low score for invalid answers
-                                    'page': i + 1
-                                })
-                            
-                        except Exception as e:
-                            print(f"    Error processing question '{q}' on page {i+1}: {e}")
-                            if q not in extracted_kv_pairs or "Error" in extracted_kv_pairs[q]:
-                                extracted_kv_pairs[q] = f"Error: {e}" # Store the error message
+                        pages_visited.add(page_idx)
+                        if progress_callback:
+                            await progress_callback(len(pages_visited), pages_total, page_idx + 1, page_answers)
 
+                if progress_callback:
+                    await progress_callback(pages_total, pages_total, None, None) # Pages skipped by early exit are done too
 
-                final_extracted_kv_pairs = {} # Final structure to hold the cleaned up results
-                CONFIDENCE_THRESHOLD = 1.0 # Set a threshold for confidence score to filter out low-confidence answers
-
-                # Define a blacklist of common problematic answers to filter out
-                ANSWER_BLACKLIST = [
-                    "PATIENT CONSENT", "PATIENT DETAILS", "MEDICAL HISTORY",
-                    "PHYSICIAN", "DOCTOR", "BIRTH", "ACTIVE TREATING PHYSICIANS",
-                    "SECONDARY INSURANCE POLICY", "PREFFERED PHARMACY", "STREET ADDRESS",
-                    "2 OF 6", "3", "4", "5", "6", # Page numbers
-                    # Add more as you observe problematic common extractions
-                ]
+                if settings.FORM_TEMPLATES_ENABLED:
+                    self._learn_field_locations(pages, extracted_kv_pairs)
+                    await asyncio.to_thread(form_template_store.save) # File lock and I/O stay off the event loop
 
+                final_extracted_kv_pairs = {} # Final structure to hold the cleaned up results
                 for question, answers in extracted_kv_pairs.items():
-                    best_answer = "Not Found" # Default if no valid answers found
-                    highest_score_for_q = -float('inf') # Initialize to negative infinity
-                    answers.sort(key=lambda x: x['score'], reverse=True) # Sort answers by score in descending order
-
-                    for item in answers:
-                        current_answer = item['answer'].strip() # Get the answer text
-                        current_score = item['score']
-
-                        if current_score < CONFIDENCE_THRESHOLD:
-                            continue # Skip answers below threshold
-
-                        # Apply blacklist filter
-                        # Check for exact match to a blacklisted term (case-insensitive for safety)
-                        if current_answer.upper() in ANSWER_BLACKLIST:
-                            continue # Skip blacklisted answers
-
-                        # Additional heuristic for numbers that might be page numbers for phone/dob/address
-                        if q in ["What is the patient's phone number?", "What is the patient's date of birth?", "What is the patient's address?"] and current_answer.isdigit() and len(current_answer) < 5:
-                             continue # Likely a page number or irrelevant digit
-
-                        best_answer = current_answer
-                        highest_score_for_q = current_score
-                        break # Found a valid answer with sufficient confidence score
-                       
-
-                    if best_answer != "Not Found":
-                        # Cleaning for "What is the patient's full name?"
-                        if q == "What is the patient's full name?":
-                            if best_answer.startswith("PATIENT DETAILS"):
-                                # This handles "PATIENT DETAILS First Name: Dylan Last Name: Wettlaufer"
-                                # We want just "Dylan Wettlaufer"
-                                best_answer = best_answer.replace("PATIENT DETAILS", "").strip()
-                                best_answer = best_answer.replace("First Name:", "").replace("Last Name:", "").strip()
-                            elif best_answer.startswith("First Name:"):
-                                best_answer = best_answer.replace("First Name:", "").replace("Last Name:", "").strip()
-
-                    
-                        final_extracted_kv_pairs[question] = best_answer
-
-                    else:
-                        # If no valid answer found, store a default message
-                        final_extracted_kv_pairs[question] = "Not Found"
-
+                    final_extracted_kv_pairs[question] = self._select_best_answer(question, answers)
+
+                # Report how much work the page ranking and early exit saved compared to asking every question on every page
+                exhaustive_passes = pages_total * len(questions_for_form)
+                fraction_saved = 1 - forward_passes / exhaustive_passes
+                analysis_results["qa_stats"] = {
+                    "forward_passes": forward_passes,
+                    "exhaustive_forward_passes": exhaustive_passes,
+                    "fraction_saved": fraction_saved,
+                    "pages_visited": len(pages_visited),
+                    "pages_skipped": pages_total - len(pages_visited),
+                    "questions_retired_early": len(questions_for_form) - len(active_questions),
+                    "template_answers": template_answers
+                }
+                metrics.observe("document_analyzer.forward_pass_fraction_saved", fraction_saved)
+                print(f"LayoutLMv3 ran {forward_passes}/{exhaustive_passes} forward passes ({fraction_saved:.0%} saved).")
 
                 analysis_results["extracted_data"] = final_extracted_kv_pairs
                 analysis_results["status"] = "completed"
@@ -267,13 +556,6 @@ class DocumentAnalyzer:
             analysis_results["error"] = f"An unexpected error occurred during document processing: {e}"
             print(f"Error analyzing document {local_file_path if local_file_path else 'unknown'}: {e}")
 
-        finally:
-            # Clean up the local file if it was downloaded
-            if local_file_path and os.path.exists(local_file_path):
-                os.remove(local_file_path)
-                print(f"Cleaned up local file: {local_file_path}")
-            print(f"Finished analysis for file: {file_path_in_supabase}, status: {analysis_results['status']}")
-
         return analysis_results
     
 
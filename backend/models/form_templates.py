@@ -0,0 +1,438 @@
+# models/form_templates.py
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Tuple, Set
+
+from config.settings import settings
+from utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+GRID_SIZE = 50 # Boxes are normalized to 0-1000, anchors are snapped to a 20x20 grid
+REGION_MARGIN = 15 # Extra room (in 0-1000 units) around a learned field box when looking up words
+MIN_ANCHORS = 8 # Layouts with fewer shared label words are too generic to become a template
+ANCHOR_DECAY_MIN_PAGES = 4 # Pages a template must have learned from before rarely seen anchors are dropped
+
+
+def _normalize_answer(answer: str) -> str:
+    return " ".join(answer.lower().replace(":", " ").split())
+
+
+class _FileLock:
+    """
+    Exclusive lock on a side file, shared by every process using the same store.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1) # Retries for ~10s, then raises
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+
+
+class FormTemplate:
+    def __init__(
+        self,
+        template_id: str,
+        anchors: Dict[str, int],
+        fields: Optional[Dict[str, Any]] = None,
+        stats: Optional[Dict[str, int]] = None,
+        pages_learned: int = 2,
+        last_used: Optional[float] = None
+    ):
+        self.id = template_id
+        self.anchors = anchors # Printed label tokens ("word@x,y") -> pages they were seen on
+        self.fields = fields or {} # question -> {"box": [x0, y0, x1, y1], "observations": n}
+        self.stats = stats or {"matches": 0, "field_hits": 0, "field_misses": 0, "qa_checks": 0, "qa_agreements": 0}
+        self.pages_learned = pages_learned # Pages the anchors and fields were learned from
+        self.last_used = last_used or time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "anchors": self.anchors,
+            "fields": self.fields,
+            "stats": self.stats,
+            "pages_learned": self.pages_learned,
+            "last_used": self.last_used
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FormTemplate":
+        return cls(data["id"], data["anchors"], data.get("fields"), data.get("stats"), data.get("pages_learned", 2), data.get("last_used"))
+
+
+class FormTemplateStore:
+    """
+    Recognizes recurring intake form layouts and remembers where each field lives on them.
+
+    A page fingerprint is the set of its label-like words snapped to a coarse grid. A layout
+    only becomes a template once a second page shares most of its fingerprint; the template
+    then keeps just the tokens both pages have in common, minus the words of the answers found
+    on them, so patient values never end up in the store. Later pages match a template when
+    they contain enough of its anchors, and anchors that stop showing up are dropped.
+    Field boxes are learned from high-confidence LayoutLMv3 answers. Once a field has been seen
+    often enough, its value can be read straight from the OCR words inside the learned box.
+
+    Every process keeps its own copy. save() periodically merges it with the file under a lock,
+    so gunicorn and bulk ingestion workers share what they learn instead of overwriting each other.
+    """
+    def __init__(self, path: str, match_threshold: float, min_observations: int, max_templates: int, anchor_share: float, save_interval: float):
+        self.path = path
+        self.match_threshold = match_threshold
+        self.min_observations = min_observations
+        self.max_templates = max_templates
+        self.anchor_share = anchor_share
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._templates: Dict[str, FormTemplate] = {}
+        self._index: Dict[str, Set[str]] = {} # anchor token -> template ids, avoids comparing against every template
+        self._candidates: List[Dict[str, Any]] = [] # Layouts seen once, kept in memory only until a second page confirms them
+        self._stat_deltas: Dict[str, Dict[str, int]] = {} # template id -> stat increments not saved yet
+        self._evicted: Set[str] = set()
+        self._dirty = False # Templates changed, not just their stats
+        self._last_save = time.monotonic()
+        self._save_lock = threading.Lock()
+        self._load()
+        atexit.register(self.save, force=True) # Flush what is still pending when the process exits
+
+    def _load(self):
+        templates = self._read_file()
+        with self._lock:
+            for template in templates.values():
+                self._add(template)
+        if templates:
+            print(f"Loaded {len(templates)} form template(s) from {self.path}")
+
+    def _read_file(self) -> Dict[str, FormTemplate]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return {data["id"]: FormTemplate.from_dict(data) for data in json.load(f)}
+        except Exception as e:
+            print(f"Could not load form templates from {self.path}: {e}")
+            return {}
+
+    def save(self, force: bool = False):
+        """
+        Merges this process's changes into the store file, at most every save_interval seconds unless forced.
+        Blocking file I/O: call it from a thread (asyncio.to_thread) when on the event loop.
+        Errors are logged, a failed save never fails an analysis.
+        """
+        if not self.path or not (self._dirty or self._stat_deltas or self._evicted):
+            return
+        if not force and time.monotonic() - self._last_save < self.save_interval:
+            return
+        if not self._save_lock.acquire(blocking=False):
+            return # Another thread of this process is already saving
+
+        try:
+            # Take the pending changes; anything learned from here on stays pending for the next save
+            with self._lock:
+                templates = copy.deepcopy(self._templates)
+                deltas, evicted = self._stat_deltas, self._evicted
+                self._stat_deltas, self._evicted = {}, set()
+                self._dirty = False
+                self._last_save = time.monotonic()
+
+            try:
+                with _FileLock(f"{self.path}.lock"): # One writer at a time across processes
+                    merged = self._merge(self._read_file(), templates, deltas, evicted)
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump([template.to_dict() for template in merged.values()], f)
+                    os.replace(tmp_path, self.path) # Atomic swap so a crash never leaves a half-written store
+            except Exception as e:
+                print(f"Could not save form templates to {self.path}: {e}")
+                with self._lock: # Keep the changes for the next attempt
+                    for template_id, template_deltas in deltas.items():
+                        pending = self._stat_deltas.setdefault(template_id, {})
+                        for key, delta in template_deltas.items():
+                            pending[key] = pending.get(key, 0) + delta
+                    self._evicted |= evicted
+                    self._dirty = True
+                return
+
+            # Pick up what the other processes learned, keeping changes made while the file was written
+            with self._lock:
+                local = self._merge(merged, self._templates, self._stat_deltas, self._evicted)
+                self._templates, self._index = {}, {}
+                for template in local.values():
+                    self._add(template)
+        finally:
+            self._save_lock.release()
+
+    def _merge(
+        self,
+        base: Dict[str, FormTemplate],
+        templates: Dict[str, FormTemplate],
+        deltas: Dict[str, Dict[str, int]],
+        evicted: Set[str]
+    ) -> Dict[str, FormTemplate]:
+        """
+        Merges templates into base: stat increments (deltas) are added, fields and anchors learned
+        from more pages win, evicted templates are dropped and the least recently used beyond
+        max_templates are removed.
+        """
+        for template_id in evicted:
+            base.pop(template_id, None)
+
+        for template in templates.values():
+            saved = base.get(template.id)
+            if saved is None:
+                base[template.id] = template
+                continue
+
+            for key, delta in deltas.get(template.id, {}).items():
+                saved.stats[key] = saved.stats.get(key, 0) + delta
+            for question, field in template.fields.items():
+                if field["observations"] > saved.fields.get(question, {}).get("observations", 0):
+                    saved.fields[question] = field
+            if template.pages_learned > saved.pages_learned:
+                saved.anchors, saved.pages_learned = template.anchors, template.pages_learned
+            saved.last_used = max(saved.last_used, template.last_used)
+
+        if len(base) > self.max_templates:
+            keep = sorted(base.values(), key=lambda t: t.last_used, reverse=True)[:self.max_templates]
+            base = {template.id: template for template in keep}
+        return base
+
+    def _add(self, template: FormTemplate):
+        self._templates[template.id] = template
+        for token in template.anchors:
+            self._index.setdefault(token, set()).add(template.id)
+
+    def _remove(self, template_id: str):
+        template = self._templates.pop(template_id)
+        for token in template.anchors:
+            ids = self._index.get(token)
+            if ids:
+                ids.discard(template_id)
+                if not ids:
+                    del self._index[token]
+
+    def _bump(self, template: FormTemplate, key: str, value: int = 1):
+        with self._lock: # save() swaps the pending deltas from another thread
+            template.stats[key] = template.stats.get(key, 0) + value
+            deltas = self._stat_deltas.setdefault(template.id, {})
+            deltas[key] = deltas.get(key, 0) + value
+
+    @staticmethod
+    def fingerprint(words: List[str], boxes: List[List[int]]) -> Set[str]:
+        """
+        Builds a page fingerprint from OCR words and their 0-1000 boxes.
+        Only label-like words (alphabetic, at least 3 letters) are used. The fingerprint still contains
+        the page's values (names, drugs, ...), it is only used in memory to find the layout's anchors.
+        """
+        tokens = set()
+        for word, box in zip(words, boxes):
+            text = word.strip(":.,;()").lower()
+            if len(text) < 3 or not text.isalpha():
+                continue
+            tokens.add(f"{text}@{box[0] // GRID_SIZE},{box[1] // GRID_SIZE}")
+        return tokens
+
+    def _best_match(self, fingerprint: Set[str]) -> Tuple[Optional[FormTemplate], float]:
+        # Similarity is the share of a template's anchors found on the page, values on the page do not count against it
+        if not fingerprint:
+            return None, 0.0
+
+        with self._lock:
+            overlap: Dict[str, int] = {}
+            for token in fingerprint:
+                for template_id in self._index.get(token, ()):
+                    overlap[template_id] = overlap.get(template_id, 0) + 1
+
+            best_template, best_similarity = None, 0.0
+            for template_id, shared in overlap.items():
+                template = self._templates[template_id]
+                similarity = shared / len(template.anchors)
+                if similarity > best_similarity:
+                    best_template, best_similarity = template, similarity
+        return best_template, best_similarity
+
+    def match(self, fingerprint: Set[str]) -> Tuple[Optional[FormTemplate], float]:
+        """
+        Returns the most similar template and its anchor similarity. The template is None below the threshold.
+        """
+        best_template, best_similarity = self._best_match(fingerprint)
+        if best_template is None or best_similarity < self.match_threshold:
+            metrics.incr("form_templates.pages_unmatched")
+            return None, best_similarity
+
+        metrics.incr("form_templates.pages_matched")
+        self._bump(best_template, "matches")
+        best_template.last_used = time.time()
+        return best_template, best_similarity
+
+    def learn_page(self, fingerprint: Set[str], fields: Dict[str, List[int]], value_tokens: Set[str]):
+        """
+        Records where the confidently answered fields of one page sit.
+        A page of a known layout refines its template. A new layout is remembered in memory and only
+        becomes a template when a second page with the same layout comes along.
+        :param fingerprint: The page fingerprint.
+        :param fields: question -> answer box (0-1000) for the page's confident answers.
+        :param value_tokens: Fingerprint tokens of the answer words, never used as anchors.
+        """
+        if not fingerprint or not fields:
+            return
+        labels = fingerprint - value_tokens
+        template, similarity = self._best_match(fingerprint)
+
+        with self._lock:
+            if template is None or similarity < self.match_threshold:
+                template = self._promote_candidate(labels, fields)
+                if template is None:
+                    return
+            else:
+                template.pages_learned += 1
+                for token in list(template.anchors):
+                    if token in value_tokens:
+                        del template.anchors[token] # An answer was found here, it is not a printed label
+                    elif token in labels:
+                        template.anchors[token] += 1
+                self._prune_anchors(template)
+                if len(template.anchors) < MIN_ANCHORS: # Nothing stable left to recognize the layout by
+                    self._remove(template.id)
+                    self._evicted.add(template.id)
+                    self._dirty = True
+                    return
+                for question, box in fields.items():
+                    self._learn_field(template, question, box)
+
+            template.last_used = time.time()
+            self._dirty = True
+
+    def _promote_candidate(self, labels: Set[str], fields: Dict[str, List[int]]) -> Optional[FormTemplate]:
+        # Caller holds the lock
+        for candidate in self._candidates:
+            shared = candidate["labels"] & labels
+            if len(shared) < MIN_ANCHORS or len(shared) / min(len(candidate["labels"]), len(labels)) < self.match_threshold:
+                continue
+
+            self._candidates.remove(candidate)
+            if len(self._templates) >= self.max_templates:
+                # Evict the template that has gone unused the longest
+                evicted = min(self._templates.values(), key=lambda t: t.last_used).id
+                self._remove(evicted)
+                self._evicted.add(evicted)
+
+            template = FormTemplate(str(uuid.uuid4()), {token: 2 for token in shared})
+            for question, box in list(candidate["fields"].items()) + list(fields.items()):
+                self._learn_field(template, question, box)
+            self._add(template)
+            metrics.incr("form_templates.templates_created")
+            return template
+
+        self._candidates.append({"labels": labels, "fields": dict(fields)})
+        if len(self._candidates) > self.max_templates:
+            self._candidates.pop(0) # Oldest one-off layout goes first
+        return None
+
+    def _prune_anchors(self, template: FormTemplate):
+        if template.pages_learned < ANCHOR_DECAY_MIN_PAGES:
+            return
+        for token, seen in list(template.anchors.items()):
+            if seen / template.pages_learned < self.anchor_share:
+                del template.anchors[token]
+                ids = self._index.get(token)
+                if ids:
+                    ids.discard(template.id)
+                    if not ids:
+                        del self._index[token]
+
+    @staticmethod
+    def _learn_field(template: FormTemplate, question: str, box: List[int]):
+        # Field boxes are kept as a running mean over all observations
+        field = template.fields.get(question)
+        if field is None:
+            template.fields[question] = {"box": list(box), "observations": 1}
+        else:
+            n = field["observations"]
+            field["box"] = [(old * n + new) / (n + 1) for old, new in zip(field["box"], box)]
+            field["observations"] = n + 1
+
+    def extract(self, template: FormTemplate, words: List[str], boxes: List[List[int]], question: str) -> Optional[str]:
+        """
+        Reads a field by region lookup: the OCR words whose centers fall inside the learned box.
+        Returns None when the field is not learned well enough or the region is empty.
+        """
+        field = template.fields.get(question)
+        if field is None or field["observations"] < self.min_observations:
+            return None
+
+        x0, y0, x1, y1 = field["box"]
+        selected = []
+        for word, box in zip(words, boxes):
+            cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+            if x0 - REGION_MARGIN <= cx <= x1 + REGION_MARGIN and y0 - REGION_MARGIN <= cy <= y1 + REGION_MARGIN:
+                selected.append(word)
+
+        if not selected:
+            self._bump(template, "field_misses")
+            metrics.incr("form_templates.field_misses")
+            return None
+
+        self._bump(template, "field_hits")
+        metrics.incr("form_templates.field_hits")
+        return " ".join(selected)
+
+    def record_agreement(self, template: FormTemplate, template_answer: str, qa_answer: str):
+        """
+        Tracks whether a template lookup agrees with a LayoutLMv3 answer on the same page.
+        """
+        agreed = _normalize_answer(template_answer) == _normalize_answer(qa_answer)
+        self._bump(template, "qa_checks")
+        self._bump(template, "qa_agreements", int(agreed))
+        metrics.incr("form_templates.qa_checks")
+        metrics.incr("form_templates.qa_agreements", int(agreed))
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            stats = []
+            for template in self._templates.values():
+                lookups = template.stats["field_hits"] + template.stats["field_misses"]
+                stats.append({
+                    "template_id": template.id,
+                    "anchors": len(template.anchors),
+                    "pages_learned": template.pages_learned,
+                    "last_used": template.last_used,
+                    "fields": {q: field["observations"] for q, field in template.fields.items()},
+                    **template.stats,
+                    "hit_rate": template.stats["field_hits"] / lookups if lookups else None,
+                    "qa_agreement_rate": template.stats["qa_agreements"] / template.stats["qa_checks"] if template.stats["qa_checks"] else None
+                })
+        return sorted(stats, key=lambda s: s["matches"], reverse=True)
+
+
+form_template_store = FormTemplateStore(
+    path=settings.FORM_TEMPLATE_STORE_PATH,
+    match_threshold=settings.FORM_TEMPLATE_MATCH_THRESHOLD,
+    min_observations=settings.FORM_TEMPLATE_MIN_OBSERVATIONS,
+    max_templates=settings.FORM_TEMPLATE_MAX_TEMPLATES,
+    anchor_share=settings.FORM_TEMPLATE_ANCHOR_SHARE,
+    save_interval=settings.FORM_TEMPLATE_SAVE_INTERVAL
+)
@@ -3,7 +3,11 @@ import torch
 from PIL import Image
 from transformers import ViTForImageClassification, ViTImageProcessor
 import os
+import time
+from typing import List, Dict, Any
 from config.settings import settings
+from models.image_preprocessing import ViTBatchPreprocessor
+from utils.metrics import metrics
 
 class ImageClassifier:
     def __init__(self, model_path: str = None):
@@ -20,8 +24,20 @@ class ImageClassifier:
             self.model.to(self.device) # Move model to GPU if available
             self.model.eval() # Set model to evaluation mode
 
+            # Batched NumPy/torch preprocessing instead of per-image ViTImageProcessor calls
+            self.preprocessor = ViTBatchPreprocessor(
+                self.processor,
+                max_batch_size=settings.IMAGE_BATCH_SIZE,
+                use_draft=settings.IMAGE_DRAFT_DECODE
+            )
+
             self.id2label = self.model.config.id2label # Mapping from label IDs to label names
             self.label2id = self.model.config.label2id # Mapping from label names to label IDs
+            # Optional per-class decision thresholds saved by model_training/train_head_from_features.py
+            self.decision_thresholds = {
+                int(self.label2id[label]): threshold
+                for label, threshold in getattr(self.model.config, "decision_thresholds", {}).items()
+            }
 
             print(f"ImageClassifier initialized. Model loaded from: {model_path}")
             print(f"Classes: {self.id2label}")
@@ -38,6 +54,39 @@ class ImageClassifier:
         """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
-        
 
+        results = await self.classify_images([image_path])
+        return results[0]["label"]
+
+    async def classify_images(self, image_paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Classifies a list of images in batches of IMAGE_BATCH_SIZE.
+        :param image_paths: Paths to the image files.
+        :return: One {'label', 'score', 'probabilities'} dict per image, in input order.
+        """
+        results = []
+        for start in range(0, len(image_paths), self.preprocessor.max_batch_size):
+            batch_paths = image_paths[start:start + self.preprocessor.max_batch_size]
+
+            preprocess_start = time.perf_counter()
+            pixel_values = self.preprocessor(batch_paths)
+            metrics.observe("image_classifier.preprocess_seconds_per_image", (time.perf_counter() - preprocess_start) / len(batch_paths))
+
+            with torch.no_grad():
+                logits = self.model(pixel_values=pixel_values.to(self.device, non_blocking=True)).logits
+            probabilities = torch.softmax(logits, dim=-1).cpu()
+
+            for probs in probabilities:
+                label_id = int(torch.argmax(probs))
+                # A thresholded class wins as soon as it reaches its threshold, same rule as in training
+                # (if several qualify, the one with the highest threshold is applied last and wins)
+                for thresholded_id, threshold in sorted(self.decision_thresholds.items(), key=lambda item: item[1]):
+                    if probs[thresholded_id] >= threshold:
+                        label_id = thresholded_id
+                results.append({
+                    "label": self.id2label[label_id],
+                    "score": probs[label_id].item(),
+                    "probabilities": {self.id2label[i]: p.item() for i, p in enumerate(probs)}
+                })
 
+        return results
@@ -0,0 +1,85 @@
+# models/image_preprocessing.py
+from typing import List, Union
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import ViTImageProcessor
+
+
+class ViTBatchPreprocessor:
+    """
+    Batched replacement for ViTImageProcessor.__call__.
+
+    JPEGs are decoded with PIL draft mode, so the decoder downscales by a power of two while
+    decoding and never materializes the full resolution image. Each image is resized once into
+    a preallocated uint8 buffer. Rescale, normalize and the HWC -> CHW layout change then run as
+    a single in-place torch op over the whole batch, writing into a reused float tensor.
+
+    ViTImageProcessor does not center crop (it resizes straight to the target size), so neither
+    does this class. With draft decoding disabled the output matches ViTImageProcessor up to float
+    rounding, see check_parity().
+
+    The returned tensor is a view into a reused buffer: consume it (e.g. run the model or copy
+    it to the GPU) before the next call. For the same reason an instance is not thread-safe,
+    give each thread its own.
+    """
+    def __init__(self, processor: ViTImageProcessor, max_batch_size: int = 32, use_draft: bool = True):
+        self.height = processor.size["height"]
+        self.width = processor.size["width"]
+        self.do_resize = processor.do_resize
+        self.resample = processor.resample
+        self.max_batch_size = max_batch_size
+        self.use_draft = use_draft
+
+        rescale = processor.rescale_factor if processor.do_rescale else 1.0
+        mean = np.array(processor.image_mean if processor.do_normalize else [0.0, 0.0, 0.0], dtype=np.float32)
+        std = np.array(processor.image_std if processor.do_normalize else [1.0, 1.0, 1.0], dtype=np.float32)
+        # (x * rescale - mean) / std folded into one multiply and one subtract per channel
+        self._scale = torch.from_numpy(rescale / std).view(1, 3, 1, 1)
+        self._shift = torch.from_numpy(mean / std).view(1, 3, 1, 1)
+
+        self._pixels = np.empty((max_batch_size, self.height, self.width, 3), dtype=np.uint8) # Decoded, resized images
+        self._inputs = torch.empty((max_batch_size, 3, self.height, self.width), dtype=torch.float32) # Model input
+        if torch.cuda.is_available():
+            self._inputs = self._inputs.pin_memory() # Faster, async host -> GPU copies
+
+    def load_image(self, image: Union[str, Image.Image]) -> Image.Image:
+        if isinstance(image, Image.Image):
+            return image.convert("RGB")
+        img = Image.open(image)
+        if self.use_draft and img.format == "JPEG":
+            img.draft("RGB", (self.width, self.height)) # Decode at the smallest 1/2^n scale still >= target size
+        return img.convert("RGB")
+
+    def __call__(self, images: List[Union[str, Image.Image]]) -> torch.Tensor:
+        """
+        Preprocesses a batch of images (paths or PIL images) into pixel values of shape (N, 3, H, W).
+        """
+        n = len(images)
+        if n > self.max_batch_size:
+            raise ValueError(f"Batch of {n} images exceeds max_batch_size={self.max_batch_size}")
+
+        for i, image in enumerate(images):
+            img = self.load_image(image)
+            if self.do_resize and img.size != (self.width, self.height):
+                img = img.resize((self.width, self.height), resample=self.resample)
+            self._pixels[i] = np.asarray(img)
+
+        batch = torch.from_numpy(self._pixels[:n]).permute(0, 3, 1, 2) # NHWC uint8 -> NCHW view, no copy
+        out = self._inputs[:n]
+        out.copy_(batch) # uint8 -> float32 into the reused tensor
+        out.mul_(self._scale).sub_(self._shift)
+        return out
+
+
+def check_parity(processor: ViTImageProcessor, images: List[Image.Image], atol: float = 1e-5) -> float:
+    """
+    Compares ViTBatchPreprocessor (without draft decoding) to ViTImageProcessor on the same images.
+    Raises AssertionError if any value differs by more than atol, returns the largest difference.
+    """
+    expected = processor(images=images, return_tensors="pt")["pixel_values"]
+    actual = ViTBatchPreprocessor(processor, max_batch_size=len(images), use_draft=False)(images)
+    max_diff = (expected - actual).abs().max().item()
+    assert max_diff <= atol, f"Preprocessing differs from ViTImageProcessor by {max_diff} (atol={atol})"
+    return max_diff
@@ -0,0 +1,44 @@
+# routers/health.py
+from fastapi import APIRouter
+from services.triage_scheduler import triage_scheduler
+from models.form_templates import form_template_store
+from utils.memory import node_memory_report
+from utils.metrics import metrics
+from db.database import get_pool_status
+
+router = APIRouter()
+
+@router.get("/")
+async def health_check():
+    """
+    Basic liveness check.
+    """
+    return {"status": "ok"}
+
+@router.get("/scheduler")
+async def scheduler_metrics():
+    """
+    Per-lane queue depth and latency metrics for the triage scheduler.
+    """
+    return triage_scheduler.get_metrics()
+
+@router.get("/form-templates")
+async def form_template_stats():
+    """
+    Per-template hit rate and agreement with LayoutLMv3 QA.
+    """
+    return form_template_store.get_stats()
+
+@router.get("/memory")
+async def memory_report():
+    """
+    RSS/PSS/USS of every worker on this node. Sum PSS for real usage, shared model weights are counted once.
+    """
+    return node_memory_report()
+
+@router.get("/db")
+async def db_metrics():
+    """
+    Connection pool usage for this worker, checkout wait times and per-CRUD-function query latency.
+    """
+    return {"pool": get_pool_status(), **metrics.snapshot("db.")}
@@ -23,6 +23,7 @@ async def get_triage_status(triage_id: str, db: AsyncSession = Depends(get_db)):
     response_data = {
         "triage_id": triage_result.id,
         "status": triage_result.status,
+        "archived": getattr(triage_result, "archived", False), # Served from the archive table
         "urgency_level": triage_result.urgency_level,
         "diagnostic_suggestions": triage_result.diagnostic_suggestions,
         "extracted_document_data": triage_result.extracted_document_data,
@@ -30,7 +31,25 @@ async def get_triage_status(triage_id: str, db: AsyncSession = Depends(get_db)):
         "created_at": triage_result.created_at.isoformat(),
         "updated_at": triage_result.updated_at.isoformat() if triage_result.updated_at else None,
         # Add details about uploaded files if needed
-        "uploaded_files": [{"original_filename": uf.original_filename, "file_type": uf.file_type, "public_url": uf.public_url} for uf in triage_result.uploaded_files]
+        "uploaded_files": [{"original_filename": uf.original_filename, "file_type": uf.file_type, "public_url": uf.public_url} for uf in triage_result.uploaded_files],
+        # Per-file progress and partial results, available before the whole triage completes
+        "progress": {
+            "files_total": len(triage_result.file_progress),
+            "files_completed": sum(1 for fp in triage_result.file_progress if fp.status in ("completed", "failed")),
+            "pages_done": sum(fp.pages_done or 0 for fp in triage_result.file_progress),
+            "pages_total": sum(fp.pages_total or 0 for fp in triage_result.file_progress),
+            "files": [
+                {
+                    "file_path": fp.file_path,
+                    "file_type": fp.file_type,
+                    "status": fp.status,
+                    "pages_done": fp.pages_done,
+                    "pages_total": fp.pages_total,
+                    "partial_result": fp.partial_result
+                }
+                for fp in triage_result.file_progress
+            ]
+        }
     }
     
     return response_data
\ No newline at end of file
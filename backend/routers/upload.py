@@ -3,11 +3,11 @@ import uuid
 from typing import List, Tuple
 from pathlib import Path
 
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException, status, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends
 from sqlalchemy.orm import Session
 
 from services.file_manager import file_manager
-from services.triage_orchestrator import triage_orchestrator
+from services.triage_scheduler import triage_scheduler
 from schemas.requests import UploadRequestMetadata
 from schemas.responses import TriageInitiatedResponse
 from config.settings import settings
@@ -21,7 +21,6 @@ router = APIRouter()
 # returns a TriageInitiatedResponse with the triage_id and a message
 @router.post("/upload", response_model=TriageInitiatedResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_files(
-    background_tasks: BackgroundTasks, # Background task to handle triage processing
     files: List[UploadFile] = File(..., description="List of files to upload"), # List of files to upload
     db: Session = Depends(get_db), # Dependency to get the database session
     metadata_json: str = Form( # Optional JSON string containing metadata
@@ -49,6 +48,7 @@ async def upload_files(
     # Generate a unique triage ID
     triage_id = str(uuid.uuid4())
     uploaded_filenames = [] # List to store filenames for database entry
+    total_pages = 0 # Total pages across all files
 
     # Create a new triage result in the database
     await create_triage_result(db, triage_id, metadata.patient_identifier)
@@ -75,6 +75,7 @@ async def upload_files(
             )
 
         uploaded_filenames.append(file.filename)  # Store the original filename for database entry
+        total_pages += await file_manager.count_pages(file) # Used by the scheduler to size the job
 
     uploaded_file_info: List[Tuple[str, str]] = [] # To store (storage_path, public_url) after upload
 
@@ -108,23 +109,25 @@ async def upload_files(
             public_url=public_url
         )
 
-    # Start the triage process in the background
-    background_tasks.add_task(
-        triage_orchestrator.start_triage_process,
-        db,
+    # Queue the triage process; the scheduler decides when it runs
+    job = await triage_scheduler.submit(
         triage_id,
         uploaded_file_info,
-        metadata.patient_identifier
+        patient_identifier=metadata.patient_identifier,
+        priority=metadata.priority,
+        source=metadata.source,
+        page_count=total_pages
     )
     return TriageInitiatedResponse( # Response model for the upload endpoint
         triage_id=triage_id,
         message="Files uploaded successfully. Triage process has been initiated.",
         status_url=f"/status/{triage_id}",
-        uploaded_filenames=[file.filename for file in files]
+        uploaded_filenames=[file.filename for file in files],
+        priority_lane=job.lane
     )
 
-# Note: The `triage_orchestrator` is assumed to be an instance of a class that handles the triage process.
-# Ensure that the `triage_orchestrator` is properly initialized in your application startup.
+# Note: The `triage_scheduler` runs triages through the `triage_orchestrator` in its own workers.
+# Ensure that the `triage_scheduler` is started in the application lifespan (see main.py).
 # This might involve importing it from the appropriate module where it's defined.
 # Ensure that the router is included in your FastAPI application
 
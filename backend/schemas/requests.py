@@ -2,9 +2,18 @@
 # This file contains request schemas for the FastAPI application.
 # It defines the data structures used for incoming requests.
 from pydantic import BaseModel, Field
+from typing import Literal, Optional
 
 class UploadRequestMetadata(BaseModel):
     patient_identifier: str = Field(
         default="anonymous",
         description="An identifier for the patient, can be a temporary ID."
+    )
+    priority: Literal["urgent", "routine", "batch"] = Field(
+        default="routine",
+        description="Requested scheduling priority. Large routine uploads may be moved to the batch lane."
+    )
+    source: Optional[str] = Field(
+        default=None,
+        description="Tenant or clinic the upload belongs to, used for fair scheduling. Defaults to the patient identifier."
     )
\ No newline at end of file
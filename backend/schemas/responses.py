@@ -2,11 +2,12 @@
 # This file contains response schemas for the FastAPI application.
 # It defines the data structures used for outgoing responses.
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 # schema for when the traige process is initiated
 class TriageInitiatedResponse(BaseModel):
     message: str = "Files uploaded and triage processing initiated."
     triage_id: str
     uploaded_filenames: List[str]
-    status_url: str
\ No newline at end of file
+    status_url: str
+    priority_lane: Optional[str] = None # Lane the scheduler placed the triage in
\ No newline at end of file
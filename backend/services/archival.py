@@ -0,0 +1,157 @@
+# services/archival.py
+# Retention job: moves finished triage results out of the hot tables into triage_results_archive.
+#
+#   python -m services.archival --days 30
+#
+# Each archived triage becomes a single compressed row. Its uploaded_files and triage_file_progress
+# rows are removed from the hot tables, so status polls only touch recent triages.
+# get_triage_result still resolves archived ids, see db/crud.py.
+import argparse
+import asyncio
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from config.settings import settings
+from db.database import AsyncSessionLocal
+from db.models import TriageResult, UploadedFile, TriageFileProgress, TriageResultArchive
+from db.crud import pack_archive_payload
+from utils.metrics import metrics
+
+ARCHIVABLE_STATUSES = ("completed", "failed")
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _build_payload(triage_result: TriageResult) -> Dict[str, Any]:
+    return {
+        "triage_result": {
+            "id": triage_result.id,
+            "patient_identifier": triage_result.patient_identifier,
+            "status": triage_result.status,
+            "urgency_level": triage_result.urgency_level,
+            "diagnostic_suggestions": triage_result.diagnostic_suggestions,
+            "extracted_document_data": triage_result.extracted_document_data,
+            "image_analysis_results": triage_result.image_analysis_results,
+            "created_at": _isoformat(triage_result.created_at),
+            "updated_at": _isoformat(triage_result.updated_at),
+        },
+        "uploaded_files": [
+            {
+                "id": uf.id,
+                "filename": uf.filename,
+                "original_filename": uf.original_filename,
+                "filepath": uf.filepath,
+                "triage_id": uf.triage_id,
+                "upload_time": _isoformat(uf.upload_time),
+                "file_type": uf.file_type,
+                "public_url": uf.public_url,
+            }
+            for uf in triage_result.uploaded_files
+        ],
+        "file_progress": [
+            {
+                "id": fp.id,
+                "triage_id": fp.triage_id,
+                "file_path": fp.file_path,
+                "file_type": fp.file_type,
+                "status": fp.status,
+                "pages_done": fp.pages_done,
+                "pages_total": fp.pages_total,
+                "partial_result": fp.partial_result,
+                "updated_at": _isoformat(fp.updated_at),
+            }
+            for fp in triage_result.file_progress
+        ],
+    }
+
+
+async def archive_batch(db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    """
+    Archives up to batch_size finished triages last updated before cutoff, in one transaction.
+    Rows locked by another worker running the same job are skipped.
+    :return: Number of triages archived.
+    """
+    result = await db.execute(
+        select(TriageResult)
+        .options(selectinload(TriageResult.uploaded_files), selectinload(TriageResult.file_progress))
+        .where(TriageResult.status.in_(ARCHIVABLE_STATUSES), TriageResult.updated_at < cutoff)
+        .order_by(TriageResult.updated_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=TriageResult)
+    )
+    triage_results = result.scalars().all()
+    if not triage_results:
+        return 0
+
+    raw_bytes = compressed_bytes = 0
+    archive_rows = []
+    for triage_result in triage_results:
+        payload = _build_payload(triage_result)
+        packed = pack_archive_payload(payload)
+        raw_bytes += len(json.dumps(payload, default=str))
+        compressed_bytes += len(packed)
+        archive_rows.append(TriageResultArchive(
+            id=triage_result.id,
+            patient_identifier=triage_result.patient_identifier,
+            status=triage_result.status,
+            created_at=triage_result.created_at,
+            payload=packed
+        ))
+
+    ids = [triage_result.id for triage_result in triage_results]
+    db.add_all(archive_rows)
+    await db.execute(delete(TriageFileProgress).where(TriageFileProgress.triage_id.in_(ids)))
+    await db.execute(delete(UploadedFile).where(UploadedFile.triage_id.in_(ids)))
+    await db.execute(delete(TriageResult).where(TriageResult.id.in_(ids)))
+    await db.commit()
+
+    metrics.incr("archival.triages_archived", len(ids))
+    print(f"Archived {len(ids)} triage result(s), ~{raw_bytes // 1024} KB -> {compressed_bytes // 1024} KB compressed.")
+    return len(ids)
+
+
+async def archive_completed_results(older_than_days: int, batch_size: int = 500) -> int:
+    """
+    Archives every finished triage older than older_than_days, batch by batch.
+    :return: Total number of triages archived.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            archived = await archive_batch(db, cutoff, batch_size)
+        total += archived
+        if archived < batch_size:
+            return total
+
+
+async def run_archival_loop():
+    """
+    Background task started from the app lifespan when ARCHIVE_AFTER_DAYS > 0.
+    """
+    while True:
+        try:
+            await archive_completed_results(settings.ARCHIVE_AFTER_DAYS, settings.ARCHIVE_BATCH_SIZE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Archival run failed: {e}")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_HOURS * 3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move finished triage results older than N days to the archive table.")
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS or 30)
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    archived_total = asyncio.run(archive_completed_results(args.days, args.batch_size))
+    print(f"Archived {archived_total} triage result(s) in total.")
@@ -4,6 +4,7 @@ import uuid
 from pathlib import Path
 from typing import List, Tuple
 import tempfile
+import fitz # PyMuPDF, used to count PDF pages
 
 from fastapi import UploadFile, HTTPException, status
 from config.settings import settings
@@ -63,6 +64,23 @@ class FileManager:
             
         return uploaded_file_info
     
+    async def count_pages(self, file: UploadFile) -> int:
+        """
+        Returns the number of pages in an uploaded file (1 for images).
+        The file is rewound afterwards so it can still be uploaded.
+        """
+        if file.content_type != "application/pdf":
+            return 1
+        try:
+            contents = await file.read()
+            with fitz.open(stream=contents, filetype="pdf") as doc:
+                return max(1, doc.page_count)
+        except Exception as e:
+            print(f"Could not count pages for {file.filename}: {e}")
+            return 1
+        finally:
+            await file.seek(0)
+
     async def download_file_from_supabase(self, supabase_path: str) -> str:
         try:
             # Supabase Python client's download method returns bytes directly on success
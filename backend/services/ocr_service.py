@@ -0,0 +1,181 @@
+# services/ocr_service.py
+# Keep this module free of heavy imports (torch, transformers): OCR workers are spawned
+# processes that import it on startup.
+import asyncio
+import multiprocessing
+import os
+import shlex
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple, Optional
+
+from PIL import Image
+from config.settings import settings
+from utils.metrics import metrics
+
+# Per worker process state, set up once by _init_worker
+_tess_api = None # tesserocr.PyTessBaseAPI when the C API bindings are installed
+_ocr_lang = "eng"
+_ocr_config = ""
+
+
+def _parse_config(config: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Splits a pytesseract style config string ("--psm 6 --oem 1 --tessdata-dir /x -c key=value")
+    into command line options and -c variables, so the C API can apply the same settings.
+    """
+    options, variables = {}, {}
+    args = shlex.split(config)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "-c" and i + 1 < len(args) and "=" in args[i + 1]:
+            key, value = args[i + 1].split("=", 1)
+            variables[key] = value
+            i += 2
+        elif arg.startswith("--") and i + 1 < len(args):
+            options[arg[2:]] = args[i + 1]
+            i += 2
+        else:
+            print(f"Ignoring unsupported OCR_CONFIG option: {arg}")
+            i += 1
+    return options, variables
+
+
+def _init_worker(tesseract_cmd: Optional[str], lang: str, config: str):
+    """
+    Runs once in every OCR worker. Loads the Tesseract language model a single time through the
+    C API (tesserocr) when available, otherwise configures pytesseract's binary path.
+    OCR_CONFIG applies to both backends (--psm, --oem, --tessdata-dir and -c key=value);
+    TESSERACT_CMD only matters for the pytesseract fallback.
+    """
+    global _tess_api, _ocr_lang, _ocr_config
+    _ocr_lang = lang
+    _ocr_config = config
+
+    try:
+        import tesserocr
+    except ImportError:
+        import pytesseract
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        print(f"WARNING: OCR worker {os.getpid()} is using pytesseract, which starts a tesseract process per page. Install tesserocr to keep the language model loaded.")
+        return
+
+    options, variables = _parse_config(config)
+    api_kwargs = {"lang": lang}
+    if "tessdata-dir" in options:
+        api_kwargs["path"] = options["tessdata-dir"]
+    if "oem" in options:
+        api_kwargs["oem"] = tesserocr.OEM(int(options["oem"]))
+    _tess_api = tesserocr.PyTessBaseAPI(**api_kwargs)
+    if "psm" in options:
+        _tess_api.SetPageSegMode(tesserocr.PSM(int(options["psm"])))
+    for key, value in variables.items():
+        if not _tess_api.SetVariable(key, value):
+            print(f"Unknown Tesseract variable in OCR_CONFIG: {key}")
+    print(f"OCR worker {os.getpid()} is using tesserocr (lang: {lang}).")
+
+
+def _normalize_box(box: Tuple[int, int, int, int], width: int, height: int) -> List[int]:
+    # LayoutLMv3 expects boxes on a 0-1000 scale
+    return [
+        int(1000 * (box[0] / width)),
+        int(1000 * (box[1] / height)),
+        int(1000 * (box[2] / width)),
+        int(1000 * (box[3] / height)),
+    ]
+
+
+def _ocr_image(image: Image.Image) -> Tuple[List[str], List[List[int]]]:
+    """
+    OCRs one image inside a worker.
+    :return: (words, boxes) with boxes as [x0, y0, x1, y1] normalized to 0-1000.
+    """
+    width, height = image.size
+    words, boxes = [], []
+
+    if _tess_api is not None:
+        import tesserocr
+        _tess_api.SetImage(image)
+        _tess_api.Recognize()
+        level = tesserocr.RIL.WORD
+        for word_result in tesserocr.iterate_level(_tess_api.GetIterator(), level):
+            word = word_result.GetUTF8Text(level)
+            if not word or not word.strip():
+                continue
+            words.append(word.strip())
+            boxes.append(_normalize_box(word_result.BoundingBox(level), width, height))
+        return words, boxes
+
+    import pytesseract
+    data = pytesseract.image_to_data(image, lang=_ocr_lang, output_type="dict", config=_ocr_config)
+    for word, left, top, w, h in zip(data["text"], data["left"], data["top"], data["width"], data["height"]):
+        if not word or not word.strip():
+            continue
+        words.append(word.strip())
+        boxes.append(_normalize_box((left, top, left + w, top + h), width, height))
+    return words, boxes
+
+
+class OCRService:
+    """
+    Pool of long-lived OCR worker processes.
+    Pages of a document are OCR'd in parallel, and each worker keeps its Tesseract
+    instance (and loaded language model) between calls instead of starting over per image.
+    """
+    def __init__(self, num_workers: int, tesseract_cmd: Optional[str], lang: str, config: str):
+        self.num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        self.tesseract_cmd = tesseract_cmd
+        self.lang = lang
+        self.config = config
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so importing this module never starts processes.
+        # Workers are spawned rather than forked so they do not inherit torch threads or model memory.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.tesseract_cmd, self.lang, self.config)
+            )
+            print(f"OCR service started with {self.num_workers} worker(s).")
+        return self._executor
+
+    async def ocr_pages(self, images: List[Image.Image]) -> List[Tuple[List[str], List[List[int]]]]:
+        """
+        OCRs all pages in parallel across the worker pool.
+        :return: One (words, boxes) tuple per image, in input order.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            executor = self._get_executor()
+            return await asyncio.gather(*[loop.run_in_executor(executor, _ocr_image, image) for image in images])
+        except BrokenProcessPool as e:
+            # A worker died (Tesseract crash, OOM kill) and took the pool with it: start a fresh pool and retry once
+            print(f"OCR worker pool broke ({e}), restarting it and retrying {len(images)} page(s).")
+            metrics.incr("ocr_service.pool_restarts")
+            self._reset_executor(executor)
+            executor = self._get_executor()
+            return await asyncio.gather(*[loop.run_in_executor(executor, _ocr_image, image) for image in images])
+
+    def _reset_executor(self, broken: ProcessPoolExecutor):
+        if self._executor is broken: # Concurrent callers may have replaced it already
+            self._executor = None
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            print("OCR service stopped.")
+
+
+ocr_service = OCRService(
+    num_workers=settings.OCR_WORKERS,
+    tesseract_cmd=settings.TESSERACT_CMD,
+    lang=settings.OCR_LANG,
+    config=settings.OCR_CONFIG
+)
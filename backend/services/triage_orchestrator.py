@@ -1,14 +1,39 @@
 # services/triage_orchestrator.py
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from typing import List, Tuple
 from sqlalchemy.orm import Session
-from db.crud import update_triage_result # Import the update function
+from db.crud import update_triage_result, create_file_progress, record_file_progress # Import the update functions
 import asyncio
 from models.document_analyzer import document_analyzer
 from config.settings import settings
 
 class TriageOrchestrator:
+    @staticmethod
+    def _page_progress_recorder(db: Session, triage_id: str, storage_path: str):
+        """
+        Builds the progress callback passed to the document analyzer.
+        Each call writes the page counter and merges only that page's answers into the file's partial result.
+        Progress is best effort: a failed write is logged and rolled back, the analysis carries on.
+        """
+        async def record(pages_done: int, pages_total: int, page_number: Optional[int], page_answers: Optional[Dict[str, Any]]):
+            try:
+                await record_file_progress(
+                    db,
+                    triage_id,
+                    storage_path,
+                    pages_done=pages_done,
+                    pages_total=pages_total,
+                    partial_patch={f"page_{page_number}": page_answers} if page_number is not None else None
+                )
+            except Exception as e:
+                print(f"[{triage_id}] Could not record progress for {storage_path}: {e}")
+                try:
+                    await db.rollback() # Leave the shared session usable for the triage's later writes
+                except Exception as rollback_error:
+                    print(f"[{triage_id}] Rollback after failed progress update failed: {rollback_error}")
+        return record
+
     async def start_triage_process(self, db: Session, triage_id: str, uploaded_file_info: List[Tuple[str]], patient_identifier: str = None):
         """
         This method will orchestrate the AI analysis in the background.
@@ -19,25 +44,43 @@ class TriageOrchestrator:
 
         await update_triage_result(db, triage_id, status="processing")
 
-        all_extracted_data_results: List[Dict[str, Any]] = []
-
+        files_to_process: List[Tuple[str, str]] = [] # (storage_path, file_type)
         for storage_path, public_url in uploaded_file_info:
             file_ext = Path(storage_path).suffix.lower()
             file_type = 'document' if file_ext == '.pdf' else \
                         'image' if file_ext in ['.jpg', '.jpeg', '.png'] else \
                         'other'
-            
-        analysis_result = await document_analyzer.analyze_document(
-            file_path_in_supabase=storage_path,
-            file_type=file_type,
-            patient_identifier=patient_identifier
-        )
+            files_to_process.append((storage_path, file_type))
 
-        
+        # One progress row per file so status readers can show completed parts early
+        await create_file_progress(db, triage_id, files_to_process)
+
+        all_extracted_data_results: List[Dict[str, Any]] = []
+
+        for storage_path, file_type in files_to_process:
+            await record_file_progress(db, triage_id, storage_path, status="processing")
 
-        all_extracted_data_results.append(analysis_result)
+            analysis_result = await document_analyzer.analyze_document(
+                file_path_in_supabase=storage_path,
+                file_type=file_type,
+                patient_identifier=patient_identifier,
+                progress_callback=self._page_progress_recorder(db, triage_id, storage_path)
+            )
 
+            # Store this file's final result right away, the other files may still take a while
+            await record_file_progress(
+                db,
+                triage_id,
+                storage_path,
+                status="completed" if analysis_result["status"] == "completed" else "failed",
+                partial_patch={
+                    "result": analysis_result["extracted_data"],
+                    "status": analysis_result["status"],
+                    "error": analysis_result["error"]
+                }
+            )
 
+            all_extracted_data_results.append(analysis_result)
 
         # --- PLACEHOLDER FOR ACTUAL AI LOGIC ---
         # Here, you would call your AI models:
@@ -0,0 +1,279 @@
+# services/triage_scheduler.py
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Any, List, Tuple, Optional
+
+from config.settings import settings
+from db.database import AsyncSessionLocal
+from db.crud import update_triage_result
+from models.document_analyzer import QUESTIONS_FOR_FORM
+from services.triage_orchestrator import triage_orchestrator
+from utils.metrics import metrics
+
+LANES = ("urgent", "routine", "batch")
+
+
+class TriageJob:
+    def __init__(
+        self,
+        triage_id: str,
+        uploaded_file_info: List[Tuple[str, str]],
+        patient_identifier: Optional[str],
+        lane: str,
+        source: str,
+        cost: int
+    ):
+        self.triage_id = triage_id
+        self.uploaded_file_info = uploaded_file_info
+        self.patient_identifier = patient_identifier
+        self.lane = lane
+        self.source = source # Tenant / patient source the job is accounted against
+        self.cost = cost # Estimated work: pages x questions
+        self.enqueued_at = time.monotonic()
+        self.finish_tag = 0.0 # Virtual finish time assigned by the scheduler
+
+
+class TriageScheduler:
+    """
+    Sits in front of TriageOrchestrator and decides which triage runs next.
+
+    Every (lane, source) pair is a flow. Jobs get a virtual finish tag of
+    max(virtual_time, last tag of the flow) + cost / lane_weight and the job with
+    the smallest tag runs first (self-clocked fair queuing). Small urgent jobs
+    therefore jump ahead of large batch uploads, while a batch lane still gets
+    its share of throughput and one busy clinic cannot starve the others.
+
+    Scheduling is non-preemptive: a running job keeps its worker until it finishes.
+    So that an urgent upload never waits behind a long chart that already started,
+    urgent_workers extra workers only ever take urgent jobs. The document analyzer
+    runs its forward passes in threads, so concurrent jobs really run side by side
+    instead of only interleaving at await points.
+    """
+    def __init__(self, concurrency: int, urgent_workers: int, lane_weights: Dict[str, float], batch_cost_threshold: int):
+        self.concurrency = max(1, concurrency)
+        self.urgent_workers = max(0, urgent_workers)
+        self.lane_weights = lane_weights
+        self.batch_cost_threshold = batch_cost_threshold
+
+        self._heap: List[Tuple[float, int, TriageJob]] = []
+        self._seq = itertools.count() # Tie breaker so equal tags stay FIFO
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[Tuple[str, str], float] = {} # Last finish tag per flow
+        self._flow_queued: Dict[Tuple[str, str], int] = {} # Queued jobs per flow
+        self._lane_queued = {lane: 0 for lane in LANES}
+        self._lane_running = {lane: 0 for lane in LANES}
+
+        self._condition: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[int, TriageJob] = {} # worker index -> job it is running
+        self._stopping = False
+
+    @staticmethod
+    def estimate_cost(page_count: int) -> int:
+        # Every page is asked every question, so work scales with pages x questions
+        return max(1, page_count) * len(QUESTIONS_FOR_FORM)
+
+    def classify_lane(self, priority: str, cost: int) -> str:
+        if priority == "urgent":
+            return "urgent"
+        if priority == "batch" or cost > self.batch_cost_threshold:
+            return "batch" # Large uploads are demoted so they cannot block routine work
+        return "routine"
+
+    async def start(self):
+        if self._workers:
+            return
+        self._condition = asyncio.Condition()
+        for worker_idx in range(self.concurrency + self.urgent_workers):
+            urgent_only = worker_idx >= self.concurrency # Reserved capacity for the urgent lane
+            self._workers.append(asyncio.create_task(self._worker(worker_idx, urgent_only)))
+        print(f"Triage scheduler started with {self.concurrency} worker(s) and {self.urgent_workers} urgent-only worker(s).")
+
+    async def stop(self, grace_seconds: float = settings.SCHEDULER_SHUTDOWN_GRACE_SECONDS):
+        """
+        Stops taking jobs, lets running jobs finish for up to grace_seconds, then cancels them.
+        Queued and interrupted triages are marked failed, the queue only lives in this process.
+        """
+        if not self._workers:
+            return
+
+        async with self._condition:
+            abandoned = [job for _, _, job in self._heap]
+            self._heap.clear()
+            self._flow_queued.clear()
+            self._flow_finish.clear()
+            for lane in LANES:
+                self._lane_queued[lane] = 0
+                metrics.set_gauge(f"scheduler.{lane}.queue_depth", 0)
+            self._stopping = True # submit() refuses new jobs from here on
+
+        deadline = time.monotonic() + grace_seconds
+        while self._running and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        abandoned.extend(self._running.values())
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._condition = None
+        self._stopping = False
+
+        if abandoned:
+            print(f"Triage scheduler stopping with {len(abandoned)} unfinished triage(s), marking them as failed.")
+            try:
+                async with AsyncSessionLocal() as db:
+                    for job in abandoned:
+                        await update_triage_result(db, job.triage_id, status="failed")
+            except Exception as e:
+                print(f"Could not mark unfinished triages as failed: {e}")
+        print("Triage scheduler stopped.")
+
+    async def submit(
+        self,
+        triage_id: str,
+        uploaded_file_info: List[Tuple[str, str]],
+        patient_identifier: Optional[str] = None,
+        priority: str = "routine",
+        source: Optional[str] = None,
+        page_count: int = 1
+    ) -> TriageJob:
+        """
+        Queues a triage for processing and returns the queued job.
+        :param priority: Requested priority from the upload metadata ("urgent", "routine" or "batch").
+        :param source: Tenant or patient source used for fair sharing. Falls back to the patient identifier.
+        :param page_count: Total number of pages across the uploaded files.
+        """
+        if self._condition is None or self._stopping:
+            raise RuntimeError("Triage scheduler is not running.")
+
+        cost = self.estimate_cost(page_count)
+        lane = self.classify_lane(priority, cost)
+        job = TriageJob(
+            triage_id=triage_id,
+            uploaded_file_info=uploaded_file_info,
+            patient_identifier=patient_identifier,
+            lane=lane,
+            source=source or patient_identifier or "anonymous",
+            cost=cost
+        )
+
+        async with self._condition:
+            flow = (job.lane, job.source)
+            start_tag = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+            job.finish_tag = start_tag + job.cost / self.lane_weights[job.lane]
+            self._flow_finish[flow] = job.finish_tag
+            self._flow_queued[flow] = self._flow_queued.get(flow, 0) + 1
+            self._lane_queued[job.lane] += 1
+
+            heapq.heappush(self._heap, (job.finish_tag, next(self._seq), job))
+            metrics.incr(f"scheduler.{job.lane}.submitted")
+            metrics.set_gauge(f"scheduler.{job.lane}.queue_depth", self._lane_queued[job.lane])
+            self._condition.notify_all() # Urgent-only workers must not swallow the wakeup for other lanes
+
+        print(f"[{triage_id}] Queued in '{lane}' lane (source: {job.source}, cost: {cost}, tag: {job.finish_tag:.2f})")
+        return job
+
+    async def _next_job(self, urgent_only: bool = False) -> TriageJob:
+        async with self._condition:
+            if urgent_only:
+                await self._condition.wait_for(lambda: self._lane_queued["urgent"] > 0)
+                # Smallest tag among urgent jobs, taken out of the middle of the heap
+                position = min((i for i, entry in enumerate(self._heap) if entry[2].lane == "urgent"), key=lambda i: self._heap[i][:2])
+                _, _, job = self._heap[position]
+                self._heap[position] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+            else:
+                await self._condition.wait_for(lambda: bool(self._heap))
+                _, _, job = heapq.heappop(self._heap)
+
+            self._virtual_time = max(self._virtual_time, job.finish_tag)
+            flow = (job.lane, job.source)
+            self._flow_queued[flow] -= 1
+            if self._flow_queued[flow] == 0:
+                del self._flow_queued[flow]
+                # Idle flows restart from the current virtual time, so their history can be dropped
+                if self._flow_finish.get(flow, 0.0) <= self._virtual_time:
+                    del self._flow_finish[flow]
+
+            self._lane_queued[job.lane] -= 1
+            self._lane_running[job.lane] += 1
+            metrics.set_gauge(f"scheduler.{job.lane}.queue_depth", self._lane_queued[job.lane])
+            metrics.set_gauge(f"scheduler.{job.lane}.running", self._lane_running[job.lane])
+            return job
+
+    async def _worker(self, worker_idx: int, urgent_only: bool = False):
+        while True:
+            job = await self._next_job(urgent_only)
+            self._running[worker_idx] = job
+            started_at = time.monotonic()
+            metrics.observe(f"scheduler.{job.lane}.queue_wait_seconds", started_at - job.enqueued_at)
+
+            try:
+                # Each job gets its own session; the request-scoped session is gone by now
+                async with AsyncSessionLocal() as db:
+                    await triage_orchestrator.start_triage_process(
+                        db,
+                        job.triage_id,
+                        job.uploaded_file_info,
+                        job.patient_identifier
+                    )
+                metrics.incr(f"scheduler.{job.lane}.completed")
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                metrics.incr(f"scheduler.{job.lane}.failed")
+                print(f"[{job.triage_id}] Triage failed in worker {worker_idx}: {e}")
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await update_triage_result(db, job.triage_id, status="failed")
+                except Exception as db_error:
+                    print(f"[{job.triage_id}] Could not mark triage as failed: {db_error}")
+
+            finally:
+                self._running.pop(worker_idx, None)
+                finished_at = time.monotonic()
+                self._lane_running[job.lane] -= 1
+                metrics.set_gauge(f"scheduler.{job.lane}.running", self._lane_running[job.lane])
+                metrics.observe(f"scheduler.{job.lane}.run_seconds", finished_at - started_at)
+                metrics.observe(f"scheduler.{job.lane}.total_latency_seconds", finished_at - job.enqueued_at)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        snapshot = metrics.snapshot(prefix="scheduler.")
+        lanes = {}
+        for lane in LANES:
+            lanes[lane] = {
+                "weight": self.lane_weights[lane],
+                "queued": self._lane_queued[lane],
+                "running": self._lane_running[lane],
+                "submitted": snapshot["counters"].get(f"scheduler.{lane}.submitted", 0),
+                "completed": snapshot["counters"].get(f"scheduler.{lane}.completed", 0),
+                "failed": snapshot["counters"].get(f"scheduler.{lane}.failed", 0),
+                "queue_wait_seconds": snapshot["latencies"].get(f"scheduler.{lane}.queue_wait_seconds"),
+                "run_seconds": snapshot["latencies"].get(f"scheduler.{lane}.run_seconds"),
+                "total_latency_seconds": snapshot["latencies"].get(f"scheduler.{lane}.total_latency_seconds"),
+            }
+        return {
+            "concurrency": self.concurrency,
+            "urgent_workers": self.urgent_workers,
+            "virtual_time": self._virtual_time,
+            "active_flows": len(self._flow_queued),
+            "lanes": lanes,
+        }
+
+
+triage_scheduler = TriageScheduler(
+    concurrency=settings.SCHEDULER_CONCURRENCY,
+    urgent_workers=settings.SCHEDULER_URGENT_WORKERS,
+    lane_weights={
+        "urgent": settings.SCHEDULER_URGENT_WEIGHT,
+        "routine": settings.SCHEDULER_ROUTINE_WEIGHT,
+        "batch": settings.SCHEDULER_BATCH_WEIGHT,
+    },
+    batch_cost_threshold=settings.SCHEDULER_BATCH_COST_THRESHOLD
+)
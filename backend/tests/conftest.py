@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Tests import backend modules the same way the app does (from models..., from services...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
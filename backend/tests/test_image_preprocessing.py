@@ -0,0 +1,106 @@
+# tests/test_image_preprocessing.py
+import io
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+from PIL import Image
+
+from models.image_preprocessing import ViTBatchPreprocessor, check_parity
+
+
+def _processor():
+    # Preprocessing config of google/vit-base-patch16-224, built locally so the test needs no download
+    return transformers.ViTImageProcessor(
+        do_resize=True,
+        size={"height": 224, "width": 224},
+        resample=Image.BILINEAR,
+        do_rescale=True,
+        rescale_factor=1 / 255,
+        do_normalize=True,
+        image_mean=[0.5, 0.5, 0.5],
+        image_std=[0.5, 0.5, 0.5]
+    )
+
+
+def _random_images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        height, width = rng.integers(100, 700, size=2)
+        images.append(Image.fromarray(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)))
+    return images
+
+
+def _jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    buffer.seek(0)
+    return buffer
+
+
+def test_matches_vit_image_processor():
+    check_parity(_processor(), _random_images(8))
+
+
+def test_matches_vit_image_processor_on_target_size_images():
+    rng = np.random.default_rng(1)
+    images = [Image.fromarray(rng.integers(0, 256, size=(224, 224, 3), dtype=np.uint8)) for _ in range(4)] # No resize needed
+    check_parity(_processor(), images)
+
+
+def test_reused_buffer_serves_smaller_batches():
+    processor = _processor()
+    preprocessor = ViTBatchPreprocessor(processor, max_batch_size=8, use_draft=False)
+    preprocessor(_random_images(8, seed=2))
+
+    images = _random_images(3, seed=3)
+    expected = processor(images=images, return_tensors="pt")["pixel_values"]
+    actual = preprocessor(images)
+    assert actual.shape == (3, 3, 224, 224)
+    assert torch.allclose(actual, expected, atol=1e-5)
+
+
+def test_rejects_batches_above_max_batch_size():
+    preprocessor = ViTBatchPreprocessor(_processor(), max_batch_size=2)
+    with pytest.raises(ValueError):
+        preprocessor(_random_images(3))
+
+
+def test_draft_decoding_stays_close_to_full_decode():
+    # Draft mode only changes how the JPEG is downscaled, the content must stay the same
+    rng = np.random.default_rng(4)
+    smooth = np.linspace(0, 255, 1600, dtype=np.float32)
+    pixels = np.stack([np.add.outer(smooth[:1200] / 2, smooth / 2)] * 3, axis=-1)
+    pixels += rng.normal(0, 4, size=pixels.shape)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    processor = _processor()
+    expected = processor(images=[Image.open(_jpeg(image))], return_tensors="pt")["pixel_values"]
+    actual = ViTBatchPreprocessor(processor, max_batch_size=1, use_draft=True)([_jpeg(image)])
+    assert (actual - expected).abs().mean().item() < 0.02 # Values are in [-1, 1]
+
+
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="Wall-clock benchmark, set RUN_BENCHMARKS=1 to run it")
+def test_faster_than_vit_image_processor():
+    processor = _processor()
+    preprocessor = ViTBatchPreprocessor(processor, max_batch_size=32, use_draft=False)
+    images = _random_images(32, seed=5)
+    processor(images=images, return_tensors="pt") # Warm up both paths
+    preprocessor(images)
+
+    def best_of(fn, repeats=5):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    reference = best_of(lambda: processor(images=images, return_tensors="pt"))
+    batched = best_of(lambda: preprocessor(images))
+    assert batched < reference, f"ViTImageProcessor: {reference * 1000:.1f} ms, ViTBatchPreprocessor: {batched * 1000:.1f} ms for 32 images"
@@ -0,0 +1,62 @@
+# utils/memory.py
+# Per-process memory accounting from /proc (Linux only).
+# PSS splits shared pages (e.g. copy-on-write model weights inherited from the gunicorn master)
+# evenly between the processes using them, so summing PSS gives real node usage; summing RSS double counts.
+import os
+from typing import Dict, Any, List, Optional
+
+_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def process_memory(pid: int) -> Optional[Dict[str, Any]]:
+    """
+    Returns RSS/PSS/USS (in MB) for a process, or None if it cannot be read.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    stats: Dict[str, Any] = {"pid": pid}
+    for line in lines:
+        parts = line.split()
+        key = parts[0].rstrip(":")
+        if key in _FIELDS:
+            stats[_FIELDS[key]] = int(parts[1]) / 1024 # kB -> MB
+    # Unique set size: memory that would be freed if this process exited
+    stats["uss_mb"] = stats.get("private_clean_mb", 0) + stats.get("private_dirty_mb", 0)
+    return stats
+
+
+def _child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def node_memory_report() -> Dict[str, Any]:
+    """
+    Memory of the current worker, its siblings (other workers of the same master) and the master.
+    """
+    master_pid = os.getppid()
+    workers = [stats for stats in (process_memory(pid) for pid in _child_pids(master_pid)) if stats]
+    if not workers: # Not running under a pre-fork master, report this process only
+        workers = [stats for stats in [process_memory(os.getpid())] if stats]
+
+    return {
+        "current_pid": os.getpid(),
+        "master": process_memory(master_pid),
+        "workers": workers,
+        "total_pss_mb": sum(w.get("pss_mb", 0) for w in workers),
+        "total_rss_mb": sum(w.get("rss_mb", 0) for w in workers),
+    }
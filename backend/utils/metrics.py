@@ -0,0 +1,98 @@
+# utils/metrics.py
+# Lightweight in-process metrics used by the scheduler, analyzers and DB layer.
+# Values are kept per worker process and exposed through the /health routes.
+import functools
+import threading
+import time
+from typing import Dict, Any
+
+
+class LatencyStat:
+    """
+    Running count/total/min/max plus a small ring buffer for percentiles.
+    """
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._window = window
+        self._recent = [] # Most recent samples, used for p50/p95
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._recent) >= self._window:
+            self._recent.pop(0)
+        self._recent.append(value)
+
+    def _percentile(self, q: float):
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self._percentile(0.50),
+            "p95": self._percentile(0.95),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._latencies: Dict[str, LatencyStat] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            stat = self._latencies.get(name)
+            if stat is None:
+                stat = self._latencies[name] = LatencyStat()
+            stat.observe(value)
+
+    def snapshot(self, prefix: str = "") -> Dict[str, Any]:
+        """
+        Returns all metrics whose name starts with prefix.
+        """
+        with self._lock:
+            return {
+                "counters": {k: v for k, v in self._counters.items() if k.startswith(prefix)},
+                "gauges": {k: v for k, v in self._gauges.items() if k.startswith(prefix)},
+                "latencies": {k: v.snapshot() for k, v in self._latencies.items() if k.startswith(prefix)},
+            }
+
+
+metrics = MetricsRegistry()
+
+
+def timed_query(func):
+    """
+    Records the latency of an async DB function as db.query.<name>_seconds.
+    """
+    name = f"db.query.{func.__name__}_seconds"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+    return wrapper
@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import torch
+from torch.utils.data import Dataset
+
+# Files written to the cache directory
+IMAGES_FILE = "images.npy" # uint8 array of shape (N, H, W, 3)
+INDEX_FILE = "index.csv" # one row per image, in the same order as images.npy
+META_FILE = "meta.json" # source hash and shape, written last so a partial build is never reused
+
+# ViT (google/vit-base-patch16-224) normalization
+IMAGE_MEAN = [0.5, 0.5, 0.5]
+IMAGE_STD = [0.5, 0.5, 0.5]
+
+
+# --- 1. Path discovery ---
+
+class ImageFile(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+
+
+def _list_images(image_dir: str) -> Dict[str, ImageFile]:
+    # One directory listing instead of an os.path.exists call per image, stats are collected in the same pass
+    images = {}
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".jpg"):
+                stat = entry.stat()
+                images[entry.name[:-4]] = ImageFile(entry.path, stat.st_size, stat.st_mtime_ns)
+    return images
+
+
+def discover_image_paths(image_ids: Sequence[str], image_dirs: Sequence[str]) -> Dict[str, ImageFile]:
+    """
+    Maps image_id -> (path, size, mtime_ns) by listing and stat-ing all image directories in parallel.
+    Earlier directories win when an id appears in several of them.
+    """
+    with ThreadPoolExecutor(max_workers=len(image_dirs)) as pool:
+        listings = list(pool.map(_list_images, image_dirs))
+
+    found = {}
+    for listing in reversed(listings):
+        found.update(listing)
+
+    missing = [image_id for image_id in image_ids if image_id not in found]
+    if missing:
+        raise FileNotFoundError(f"Image file not found for {len(missing)} image(s), e.g. {missing[:5]}")
+    return {image_id: found[image_id] for image_id in image_ids}
+
+
+# --- 2. One-time preprocessing into a memory-mapped array ---
+
+def compute_source_hash(metadata_file: str, paths: Sequence[str], sizes: Sequence[int], mtimes_ns: Sequence[int], image_size: int) -> str:
+    """
+    Hash of the metadata CSV, every image's path/size/mtime and the target size.
+    Any change to the source data invalidates the cache.
+    """
+    digest = hashlib.sha256()
+    with open(metadata_file, "rb") as f:
+        digest.update(f.read())
+    for path, size, mtime_ns in zip(paths, sizes, mtimes_ns):
+        digest.update(f"{path}|{size}|{mtime_ns}\n".encode())
+    digest.update(str(image_size).encode())
+    return digest.hexdigest()
+
+
+def _load_resized(path: str, image_size: int) -> np.ndarray:
+    img = Image.open(path)
+    img.draft("RGB", (image_size, image_size)) # Let the JPEG decoder downscale while decoding
+    img = img.convert("RGB").resize((image_size, image_size), resample=Image.BILINEAR)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _write_chunk(images_path: str, paths: List[str], start: int, image_size: int):
+    # Each worker opens the memmap itself and fills its own slice
+    images = np.load(images_path, mmap_mode="r+")
+    for offset, path in enumerate(paths):
+        images[start + offset] = _load_resized(path, image_size)
+    images.flush()
+
+
+def build_image_cache(
+    df: pd.DataFrame,
+    metadata_file: str,
+    cache_dir: str,
+    image_size: int = 224,
+    num_workers: Optional[int] = None,
+    chunk_size: int = 256
+) -> str:
+    """
+    Decodes and resizes every image once into cache_dir/images.npy and writes the label/metadata index.
+    df must have 'path', 'file_size' and 'mtime_ns' columns (see discover_image_paths); the other
+    columns are saved to the index as-is.
+    Returns cache_dir. An existing cache is reused when its source hash still matches.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, META_FILE)
+    images_path = os.path.join(cache_dir, IMAGES_FILE)
+    paths = df["path"].tolist()
+
+    print("Hashing image sources...")
+    source_hash = compute_source_hash(metadata_file, paths, df["file_size"].tolist(), df["mtime_ns"].tolist(), image_size)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("source_hash") == source_hash:
+            print(f"Using cached images in {cache_dir}")
+            return cache_dir
+        os.remove(meta_path) # Stale cache, rebuild
+
+    print(f"Preprocessing {len(paths)} images into {images_path}...")
+    images = np.lib.format.open_memmap(images_path, mode="w+", dtype=np.uint8, shape=(len(paths), image_size, image_size, 3))
+    del images # Workers reopen it
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = [
+            pool.submit(_write_chunk, images_path, paths[start:start + chunk_size], start, image_size)
+            for start in range(0, len(paths), chunk_size)
+        ]
+        for future in futures:
+            future.result()
+
+    df.reset_index(drop=True).to_csv(os.path.join(cache_dir, INDEX_FILE), index=False)
+    with open(meta_path, "w") as f:
+        json.dump({"source_hash": source_hash, "count": len(paths), "image_size": image_size}, f)
+    print(f"Image cache written to {cache_dir}")
+    return cache_dir
+
+
+def load_index(cache_dir: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(cache_dir, INDEX_FILE))
+
+
+# --- 3. Dataset ---
+
+class MemmapSkinDataset(Dataset):
+    """
+    Serves preprocessed images straight from the memory-mapped cache, no JPEG decoding.
+    The memmap is opened lazily so every DataLoader worker gets its own handle.
+    """
+    def __init__(self, cache_dir: str, indices: Sequence[int], labels: Sequence[int], transform=None):
+        self.images_path = os.path.join(cache_dir, IMAGES_FILE)
+        self.indices = np.asarray(indices)
+        self.labels = np.asarray(labels)
+        self.transform = transform # Optional augmentation on the (3, H, W) float tensor
+        self._images = None
+        self._mean = torch.tensor(IMAGE_MEAN).view(3, 1, 1)
+        self._std = torch.tensor(IMAGE_STD).view(3, 1, 1)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode="r")
+
+        image = torch.from_numpy(np.array(self._images[self.indices[idx]])) # Copy out of the read-only map
+        pixel_values = (image.permute(2, 0, 1).float() / 255.0 - self._mean) / self._std
+        if self.transform:
+            pixel_values = self.transform(pixel_values)
+
+        return {"pixel_values": pixel_values, "labels": int(self.labels[idx])}
@@ -0,0 +1,205 @@
+# Fast head-only retraining for the skin classifier.
+#
+# Runs the frozen ViT backbone once over the memmap image cache (see dataset_cache.py), stores the
+# pooled [CLS] embeddings on disk, and then trains/evaluates only the classification head from those
+# embeddings. Changing class weighting or decision thresholds re-runs in minutes on CPU without
+# touching the encoder again. The result is saved as a regular ViTForImageClassification checkpoint
+# that backend/models/image_classifier.py can load.
+#
+#   python train_head_from_features.py --class-weighting balanced --threshold mel=0.3
+import os
+import json
+import argparse
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score, recall_score
+from tqdm import tqdm
+
+from transformers import ViTForImageClassification, ViTImageProcessor
+
+from dataset_cache import MemmapSkinDataset, load_index, META_FILE
+
+FEATURES_FILE = "features.npy" # float32 array of shape (N, hidden_size)
+FEATURES_META_FILE = "features_meta.json"
+
+
+# --- 1. Backbone pass, cached ---
+
+def extract_features(cache_dir: str, feature_dir: str, backbone: str, batch_size: int, num_workers: int) -> np.ndarray:
+    """
+    Returns the pooled embedding of every cached image, computing them only when the image cache
+    or the backbone changed since the last run.
+    """
+    os.makedirs(feature_dir, exist_ok=True)
+    features_path = os.path.join(feature_dir, FEATURES_FILE)
+    meta_path = os.path.join(feature_dir, FEATURES_META_FILE)
+
+    with open(os.path.join(cache_dir, META_FILE)) as f:
+        image_cache_hash = json.load(f)["source_hash"]
+    expected_meta = {"image_cache_hash": image_cache_hash, "backbone": backbone}
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == expected_meta:
+                print(f"Using cached features in {features_path}")
+                return np.load(features_path, mmap_mode="r")
+        os.remove(meta_path) # Stale, recompute
+
+    index = load_index(cache_dir)
+    dataset = MemmapSkinDataset(cache_dir, np.arange(len(index)), index["label_id"].values)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+    encoder = ViTForImageClassification.from_pretrained(backbone).vit # Backbone only, ends with the final layernorm
+    encoder.eval()
+
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=np.float32, shape=(len(dataset), encoder.config.hidden_size)
+    )
+    offset = 0
+    with torch.no_grad():
+        for batch in tqdm(loader, desc="Extracting backbone features"):
+            hidden = encoder(pixel_values=batch["pixel_values"]).last_hidden_state
+            pooled = hidden[:, 0, :] # [CLS] token, the same input ViTForImageClassification's classifier sees
+            features[offset:offset + len(pooled)] = pooled.numpy()
+            offset += len(pooled)
+    features.flush()
+
+    with open(meta_path, "w") as f:
+        json.dump(expected_meta, f) # Written last, marks the features as complete
+    return np.load(features_path, mmap_mode="r")
+
+
+# --- 2. Head training and evaluation ---
+
+def class_weights(labels: np.ndarray, num_labels: int, mode: str) -> torch.Tensor:
+    counts = np.bincount(labels, minlength=num_labels).astype(np.float32)
+    counts[counts == 0] = 1
+    if mode == "balanced":
+        weights = len(labels) / (num_labels * counts)
+    elif mode == "sqrt":
+        weights = np.sqrt(len(labels) / (num_labels * counts))
+    else:
+        weights = np.ones(num_labels, dtype=np.float32)
+    return torch.from_numpy(weights.astype(np.float32))
+
+
+def train_head(features: torch.Tensor, labels: torch.Tensor, num_labels: int, weights: torch.Tensor, epochs: int, lr: float, batch_size: int) -> nn.Linear:
+    head = nn.Linear(features.shape[1], num_labels)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=1e-4)
+    loss_fn = nn.CrossEntropyLoss(weight=weights)
+
+    for epoch in range(epochs):
+        permutation = torch.randperm(len(features))
+        total_loss = 0.0
+        for start in range(0, len(features), batch_size):
+            batch = permutation[start:start + batch_size]
+            optimizer.zero_grad()
+            loss = loss_fn(head(features[batch]), labels[batch])
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        if (epoch + 1) % 10 == 0 or epoch == epochs - 1:
+            print(f"Epoch {epoch + 1}/{epochs}, loss: {total_loss / len(features):.4f}")
+    return head
+
+
+def predict(probabilities: torch.Tensor, thresholds: dict) -> torch.Tensor:
+    """
+    argmax, except that a class listed in thresholds wins whenever its probability reaches the threshold
+    (e.g. flag melanoma at 0.3 instead of waiting for it to be the top class).
+    """
+    predictions = probabilities.argmax(dim=-1)
+    for label_id, threshold in sorted(thresholds.items(), key=lambda item: item[1]):
+        predictions[probabilities[:, label_id] >= threshold] = label_id
+    return predictions
+
+
+def evaluate(head: nn.Linear, features: torch.Tensor, labels: torch.Tensor, thresholds: dict, id2label: dict):
+    with torch.no_grad():
+        probabilities = torch.softmax(head(features), dim=-1)
+    predictions = predict(probabilities, thresholds).numpy()
+    y_true = labels.numpy()
+
+    print(f"Accuracy: {accuracy_score(y_true, predictions):.4f}")
+    print(f"Macro F1: {f1_score(y_true, predictions, average='macro'):.4f}")
+    recalls = recall_score(y_true, predictions, average=None, labels=list(id2label.keys()), zero_division=0)
+    for label_id, recall in zip(id2label.keys(), recalls):
+        print(f"  Recall {id2label[label_id]:>6}: {recall:.4f}")
+
+
+# --- 3. Export ---
+
+def save_checkpoint(head: nn.Linear, backbone: str, output_dir: str, id2label: dict, thresholds: dict):
+    model = ViTForImageClassification.from_pretrained(
+        backbone,
+        num_labels=len(id2label),
+        id2label=id2label,
+        label2id={label: label_id for label_id, label in id2label.items()},
+        ignore_mismatched_sizes=True # The ImageNet head is replaced by ours
+    )
+    model.classifier.load_state_dict(head.state_dict())
+    model.config.decision_thresholds = {id2label[label_id]: threshold for label_id, threshold in thresholds.items()}
+    model.save_pretrained(output_dir)
+    ViTImageProcessor.from_pretrained(backbone).save_pretrained(output_dir)
+    print(f"Saved checkpoint to {output_dir}")
+
+
+def parse_thresholds(values, label2id: dict) -> dict:
+    thresholds = {}
+    for value in values or []:
+        label, threshold = value.split("=")
+        thresholds[label2id[label]] = float(threshold)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the skin classifier head on cached frozen-backbone features.")
+    parser.add_argument("--cache-dir", default="data/skin_lesion_cache", help="Image cache built by dataset_cache.build_image_cache")
+    parser.add_argument("--feature-dir", default="data/skin_lesion_features", help="Where pooled embeddings are cached")
+    parser.add_argument("--backbone", default="google/vit-base-patch16-224")
+    parser.add_argument("--output-dir", default="./skin_cancer_vit_head_model")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--class-weighting", choices=["none", "balanced", "sqrt"], default="balanced")
+    parser.add_argument("--threshold", action="append", help="Decision threshold as label=prob, e.g. mel=0.3 (repeatable). With --eval-only, defaults to the checkpoint's thresholds")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--eval-only", action="store_true", help="Only evaluate the head of an existing --output-dir checkpoint")
+    args = parser.parse_args()
+
+    index = load_index(args.cache_dir)
+    id2label = dict(sorted(zip(index["label_id"].astype(int), index["dx"])))
+    label2id = {label: label_id for label_id, label in id2label.items()}
+    thresholds = parse_thresholds(args.threshold, label2id)
+
+    features = torch.from_numpy(np.array(extract_features(args.cache_dir, args.feature_dir, args.backbone, args.batch_size, args.num_workers)))
+    labels = torch.from_numpy(index["label_id"].values.astype(np.int64))
+
+    # Same split as train_skin_classifier.py
+    train_idx, val_idx = train_test_split(np.arange(len(index)), test_size=0.2, stratify=index["label_id"], random_state=42)
+
+    if args.eval_only:
+        model = ViTForImageClassification.from_pretrained(args.output_dir)
+        head = model.classifier
+        if not args.threshold:
+            # Evaluate with the thresholds ImageClassifier will apply to this checkpoint
+            saved_thresholds = getattr(model.config, "decision_thresholds", None) or {}
+            thresholds = {label2id[label]: threshold for label, threshold in saved_thresholds.items()}
+            print(f"Using the checkpoint's decision thresholds: {saved_thresholds or 'none'}")
+    else:
+        weights = class_weights(labels[train_idx].numpy(), len(id2label), args.class_weighting)
+        head = train_head(features[train_idx], labels[train_idx], len(id2label), weights, args.epochs, args.learning_rate, args.batch_size)
+
+    print("Validation:")
+    evaluate(head, features[val_idx], labels[val_idx], thresholds, id2label)
+
+    if not args.eval_only:
+        save_checkpoint(head, args.backbone, args.output_dir, id2label, thresholds)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@ import pandas as pd
 import numpy as np
 from PIL import Image
 from sklearn.model_selection import train_test_split
-from tqdm import tqdm
 import matplotlib.pyplot as plt
 
 import torch
@@ -13,6 +12,8 @@ from torchvision import transforms
 from transformers import ViTForImageClassification, ViTImageProcessor, TrainingArguments, Trainer
 from sklearn.metrics import accuracy_score, f1_score
 
+from dataset_cache import discover_image_paths, build_image_cache, MemmapSkinDataset
+
 # Constants for dataset paths and metadata
 DATASET_ROOT = "data/skin_lesion_images"
 METADATA_FILE = os.path.join(DATASET_ROOT, 'HAM10000_metadata.csv')
@@ -22,37 +23,54 @@ IMAGE_DIR_PART2 = os.path.join(DATASET_ROOT, 'HAM10000_images_part2')
 MODEL_CHECKPOINT = "google/vit-base-patch16-224"
 OUTPUT_DIR = "./skin_cancer_vit_model"
 
+CACHE_DIR = "data/skin_lesion_cache" # Preprocessed 224x224 images (memmap) + index, rebuilt when the source hash changes
+NUM_DATALOADER_WORKERS = os.cpu_count() or 1
+
 BATCH_SIZE = 16 # Adjust based on your GPU memory
 NUM_EPOCHS = 3 # Start with a few epochs, adjust as needed
 LEARNING_RATE = 2e-5 # Common fine-tuning learning rate
 
-# --- 1. Load Data Paths and Labels ---
-print("Loading metadata and image paths...")
-df = pd.read_csv(METADATA_FILE)
 
-# Map image_id to full path
-image_paths = {}
-for image_id in tqdm(df['image_id'].unique(), desc="Mapping image paths"):
-    path1 = os.path.join(IMAGE_DIR_PART1, f"{image_id}.jpg")
-    path2 = os.path.join(IMAGE_DIR_PART2, f"{image_id}.jpg")
+def main():
+    # --- 1. Load Data Paths and Labels ---
+    print("Loading metadata and image paths...")
+    df = pd.read_csv(METADATA_FILE)
+
+    # Map image_id to full path, size and mtime (both image folders are listed in parallel)
+    image_files = discover_image_paths(df['image_id'].unique().tolist(), [IMAGE_DIR_PART1, IMAGE_DIR_PART2])
+    df["path"] = df["image_id"].map(lambda image_id: image_files[image_id].path)
+    df["file_size"] = df["image_id"].map(lambda image_id: image_files[image_id].size)
+    df["mtime_ns"] = df["image_id"].map(lambda image_id: image_files[image_id].mtime_ns)
+
+    # Map labels to integers
+    label_mapping = {
+        'nv': 0, 'mel': 1, 'bkl': 2, 'bcc': 3,
+        'akiec': 4, 'vasc': 5, 'df': 6
+    }
+
+    df['label_id'] = df['dx'].map(label_mapping)
+
+
+    # --- 2. Preprocess once into the memmap cache ---
+    build_image_cache(df, METADATA_FILE, CACHE_DIR)
+    df = df.reset_index(drop=True) # Row i of df is image i of the cache
 
-    if os.path.exists(path1):
-        image_paths[image_id] = path1
-    elif os.path.exists(path2):
-        image_paths[image_id] = path2
-    else:
-        raise FileNotFoundError(f"Image file not found for {image_id} in both parts.")
-    
-df["path"] = df["image_id"].map(image_paths)
-df = df.dropna(subset=['path'])
+    train_idx, val_idx = train_test_split(
+        df.index.values,
+        test_size=0.2,
+        stratify=df['label_id'],
+        random_state=42
+    )
 
-# Map labels to integers
-label_mapping = {
-    'nv': 0, 'mel': 1, 'bkl': 2, 'bcc': 3,
-    'akiec': 4, 'vasc': 5, 'df': 6
-}
+    train_dataset = MemmapSkinDataset(CACHE_DIR, train_idx, df.loc[train_idx, 'label_id'].values)
+    val_dataset = MemmapSkinDataset(CACHE_DIR, val_idx, df.loc[val_idx, 'label_id'].values)
 
-df['label_id'] = df['dx'].map(label_mapping)
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=NUM_DATALOADER_WORKERS, persistent_workers=True)
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=NUM_DATALOADER_WORKERS, persistent_workers=True)
 
+    print(f"Train: {len(train_dataset)} images, validation: {len(val_dataset)} images")
 
 
+if __name__ == "__main__":
+    # Guarded so spawned cache/DataLoader workers can re-import this module without rerunning the pipeline
+    main()